@@ -0,0 +1,280 @@
+from bisect import bisect_left
+from itertools import groupby
+from operator import itemgetter
+
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QTreeView
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QDate, pyqtSignal
+
+from database import DONE_COLUMN, day_stats, range_page
+from Widgets import HEADERS
+import theme
+
+FETCH_SIZE = 200  # задач за один вызов fetchMore
+WEEKDAYS = ("Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс")
+
+
+def week_range(date):
+    """Понедельник и воскресенье недели, в которую входит date"""
+    start = date.addDays(1 - date.dayOfWeek())
+    return start, start.addDays(6)
+
+
+def month_range(date):
+    start = QDate(date.year(), date.month(), 1)
+    return start, start.addMonths(1).addDays(-1)
+
+
+class DaySection:
+    __slots__ = ("date_str", "date", "title", "rows", "collapsed")
+
+    def __init__(self, date_str, total, done):
+        self.date_str = date_str
+        self.date = QDate.fromString(date_str, "yyyy-MM-dd")
+        self.title = (f"{WEEKDAYS[self.date.dayOfWeek() - 1]}, {self.date.toString('dd.MM.yyyy')}  —  "
+                      f"задач: {total}, сделано: {done}")
+        self.rows = []
+        self.collapsed = False
+
+
+class RangeModel(QAbstractTableModel):
+    """Задачи диапазона дат, сгруппированные по дням (только чтение).
+
+    Строки модели плоские: заголовок дня и под ним строки его задач; у свёрнутого дня остаётся только заголовок.
+    Задачи читаются страницами по ключу (дата, номер строки), когда представление докручивается
+    до конца уже загруженного (canFetchMore/fetchMore); итоги дней берутся заранее одним запросом.
+    """
+
+    def __init__(self, start_date_str, end_date_str, parent=None):
+        super().__init__(parent)
+        self.sections = []
+        # Видимые строки: (номер дня, номер задачи в дне), у заголовка дня номер задачи -1
+        self._rows = []
+        self._stats = day_stats(start_date_str, end_date_str)
+        self._end = end_date_str
+        self._after = (start_date_str, -1)
+        self._exhausted = False
+        self._fetching = False
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def hasChildren(self, parent=QModelIndex()):
+        # Пока диапазон не дочитан, у корня есть строки, даже если ни одна ещё не загружена
+        return not parent.isValid() and (bool(self._rows) or not self._exhausted)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return HEADERS[section]
+        return None
+
+    def flags(self, index):
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable
+
+    def is_header(self, row):
+        return self._rows[row][1] < 0
+
+    def section_of(self, row):
+        return self.sections[self._rows[row][0]]
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        number, task = self._rows[index.row()]
+        section = self.sections[number]
+        if task < 0:
+            if role == Qt.DisplayRole and index.column() == 0:
+                return ("▶  " if section.collapsed else "▼  ") + section.title
+            if role == Qt.ForegroundRole:
+                return theme.color(theme.ACCENT_LIGHT)
+            return None
+
+        text = section.rows[task][index.column()]
+        if role == Qt.DisplayRole:
+            # Строки одинаковой высоты: многострочный текст показывается в одну строку, целиком — в подсказке
+            return text.replace("\n", " ")
+        if role == Qt.ToolTipRole:
+            return text or None
+        if role == Qt.TextAlignmentRole and index.column() == DONE_COLUMN:
+            return Qt.AlignCenter
+        return None
+
+    # Сворачивание дней
+
+    def _header_row(self, number):
+        return bisect_left(self._rows, (number, -1))
+
+    def toggle(self, row):
+        """Сворачивает или разворачивает день, заголовок которого стоит в строке row"""
+        number = self._rows[row][0]
+        self.set_collapsed(number, not self.sections[number].collapsed)
+
+    def set_collapsed(self, number, collapsed):
+        section = self.sections[number]
+        if section.collapsed == collapsed:
+            return
+        section.collapsed = collapsed
+        header = self._header_row(number)
+        self.dataChanged.emit(self.index(header, 0), self.index(header, 0), [Qt.DisplayRole])
+        if not section.rows:
+            return
+        first, last = header + 1, header + len(section.rows)
+        if collapsed:
+            self.beginRemoveRows(QModelIndex(), first, last)
+            del self._rows[first:last + 1]
+            self.endRemoveRows()
+        else:
+            self.beginInsertRows(QModelIndex(), first, last)
+            self._rows[first:first] = [(number, task) for task in range(len(section.rows))]
+            self.endInsertRows()
+
+    def set_all_collapsed(self, collapsed):
+        self.beginResetModel()
+        self._rows = []
+        for number, section in enumerate(self.sections):
+            section.collapsed = collapsed
+            self._rows.append((number, -1))
+            if not collapsed:
+                self._rows.extend((number, task) for task in range(len(section.rows)))
+        self.endResetModel()
+
+    # Порционное чтение
+
+    def canFetchMore(self, parent=QModelIndex()):
+        # Представление может снова спросить о порции из обработчиков вставки текущей — её нужно дочитать первой
+        return not parent.isValid() and not self._exhausted and not self._fetching
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        records = range_page(self._after, self._end, FETCH_SIZE)
+        if len(records) < FETCH_SIZE:
+            self._exhausted = True
+        if records:
+            self._after = records[-1][:2]
+
+        self._fetching = True
+        try:
+            self._insert_records(records)
+        finally:
+            self._fetching = False
+
+    def _insert_records(self, records):
+        for date_str, group in groupby(records, key=itemgetter(0)):
+            group = list(group)
+            if self.sections and self.sections[-1].date_str == date_str:
+                # Продолжение дня, начатого предыдущей порцией
+                number = len(self.sections) - 1
+                section = self.sections[number]
+                added = [(number, task) for task in range(len(section.rows), len(section.rows) + len(group))]
+            else:
+                number = len(self.sections)
+                section = DaySection(date_str, *self._stats.get(date_str, (len(group), 0)))
+                self.sections.append(section)
+                added = [(number, -1)] + [(number, task) for task in range(len(group))]
+            section.rows.extend(cells for _, _, cells in group)
+            if section.collapsed:
+                continue
+            first = len(self._rows)
+            self.beginInsertRows(QModelIndex(), first, first + len(added) - 1)
+            self._rows.extend(added)
+            self.endInsertRows()
+
+
+class RangeWindow(QWidget):
+    """Задачи недели или месяца в одном окне, сгруппированные по дням; выбор строки открывает её день"""
+    date_selected = pyqtSignal(QDate)
+
+    def __init__(self):
+        super().__init__()
+        self.setObjectName("rangeWindow")
+        self.resize(1100, 700)
+        self.span = "week"
+        # Дата, от которой строится период: переключение неделя/месяц и листание не сдвигают её к началу периода
+        self.anchor = None
+        self.start_date = self.end_date = None
+        self.model = None
+
+        layout = QVBoxLayout(self)
+        bar = QHBoxLayout()
+        previous_button = QPushButton("◀")
+        next_button = QPushButton("▶")
+        week_button = QPushButton("Неделя")
+        month_button = QPushButton("Месяц")
+        expand_button = QPushButton("Развернуть все")
+        collapse_button = QPushButton("Свернуть все")
+        self.range_label = QLabel()
+        self.range_label.setObjectName("rangeLabel")
+        previous_button.clicked.connect(lambda: self.step(-1))
+        next_button.clicked.connect(lambda: self.step(1))
+        week_button.clicked.connect(lambda: self.show_span(self.anchor, "week"))
+        month_button.clicked.connect(lambda: self.show_span(self.anchor, "month"))
+        for widget in (previous_button, self.range_label, next_button, week_button, month_button):
+            bar.addWidget(widget)
+        bar.addStretch()
+        bar.addWidget(expand_button)
+        bar.addWidget(collapse_button)
+        layout.addLayout(bar)
+
+        # Плоский список: заголовки дней и задачи на одном уровне, представление видит столько строк, сколько показывает
+        self.view = QTreeView()
+        self.view.setRootIsDecorated(False)
+        self.view.setItemsExpandable(False)
+        # Одинаковая высота строк позволяет представлению не измерять строки за пределами экрана
+        self.view.setUniformRowHeights(True)
+        self.view.setAllColumnsShowFocus(True)
+        self.view.clicked.connect(self.toggle_day)
+        self.view.activated.connect(self.open_day)
+        expand_button.clicked.connect(lambda: self.model.set_all_collapsed(False))
+        collapse_button.clicked.connect(lambda: self.model.set_all_collapsed(True))
+        layout.addWidget(self.view)
+
+    def show_span(self, date, span):
+        """Показать неделю или месяц, в которые входит date"""
+        self.anchor, self.span = date, span
+        start_date, end_date = week_range(date) if span == "week" else month_range(date)
+        self.show_range(start_date, end_date)
+
+    def step(self, direction):
+        if self.span == "week":
+            self.show_span(self.anchor.addDays(7 * direction), "week")
+        else:
+            self.show_span(self.anchor.addMonths(direction), "month")
+
+    def show_range(self, start_date, end_date):
+        self.start_date, self.end_date = start_date, end_date
+        old_model = self.model
+        self.model = RangeModel(start_date.toString("yyyy-MM-dd"), end_date.toString("yyyy-MM-dd"), self)
+        # Первую порцию представление прочитает само при раскладке строк, остальные — по мере прокрутки
+        self.view.setModel(self.model)
+        # После setModel: при сбросе модели представление сначала забывает свои объединённые строки
+        self.model.rowsInserted.connect(self.rows_inserted)
+        self.model.modelReset.connect(lambda: self.rows_inserted(QModelIndex(), 0, self.model.rowCount() - 1))
+        if old_model is not None:
+            old_model.deleteLater()
+
+        period = f"{start_date.toString('dd.MM.yyyy')} — {end_date.toString('dd.MM.yyyy')}"
+        self.range_label.setText(period)
+        self.setWindowTitle(f"Задачи: {period}")
+
+    def rows_inserted(self, parent, first, last):
+        # Заголовки дней занимают всю ширину строки
+        for row in range(first, last + 1):
+            if self.model.is_header(row):
+                self.view.setFirstColumnSpanned(row, QModelIndex(), True)
+
+    def toggle_day(self, index):
+        if self.model.is_header(index.row()):
+            self.model.toggle(index.row())
+
+    def open_day(self, index):
+        if not self.model.is_header(index.row()):
+            self.date_selected.emit(self.model.section_of(index.row()).date)
+
+    def keyPressEvent(self, event):
+        if event.key() == Qt.Key_Escape:
+            self.close()
+        else:
+            super().keyPressEvent(event)
@@ -0,0 +1,81 @@
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QDateEdit, QTableWidget, \
+    QTableWidgetItem, QHeaderView
+from PyQt5.QtCore import Qt
+
+from analytics import range_stats
+from database import format_duration
+
+
+class StatsWindow(QWidget):
+    """Окно статистики: план и факт по времени, сферы деятельности, выполнение и энергия за период"""
+
+    def __init__(self, start_date, end_date):
+        super().__init__()
+        self.setWindowTitle("Статистика")
+        self.setObjectName("statsWindow")
+        self.resize(900, 650)
+
+        layout = QVBoxLayout(self)
+
+        range_bar = QHBoxLayout()
+        self.start_edit = QDateEdit(start_date)
+        self.end_edit = QDateEdit(end_date)
+        for edit in (self.start_edit, self.end_edit):
+            edit.setCalendarPopup(True)
+            edit.setDisplayFormat("dd.MM.yyyy")
+        show_button = QPushButton("Показать")
+        show_button.clicked.connect(self.refresh)
+        range_bar.addWidget(QLabel("С"))
+        range_bar.addWidget(self.start_edit)
+        range_bar.addWidget(QLabel("по"))
+        range_bar.addWidget(self.end_edit)
+        range_bar.addWidget(show_button)
+        range_bar.addStretch()
+        layout.addLayout(range_bar)
+
+        self.summary = QLabel()
+        self.summary.setAlignment(Qt.AlignLeft | Qt.AlignTop)
+        layout.addWidget(self.summary)
+
+        self.spheres = QTableWidget(0, 5)
+        self.spheres.setHorizontalHeaderLabels(["Сфера деятельности", "Задач", "Сделано", "Время пот", "Время факт"])
+        self.spheres.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.spheres.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(self.spheres)
+
+        self.refresh()
+
+    def refresh(self):
+        stats = range_stats(self.start_edit.date().toString("yyyy-MM-dd"),
+                            self.end_edit.date().toString("yyyy-MM-dd"))
+
+        overrun = stats["overrun_seconds"]
+        energy = ", ".join(f"{title}: {'—' if mean is None else f'{mean:.1f}'}"
+                           for title, mean in stats["energy_means"].items())
+        self.summary.setText("\n".join([
+            f"Дней с задачами: {stats['days']}",
+            f"Задач: {stats['tasks']}, сделано: {stats['done']} ({stats['completion_rate']:.0%})",
+            f"Время пот: {format_duration(int(stats['planned_seconds']))}, "
+            f"время факт: {format_duration(int(stats['actual_seconds']))}",
+            f"Отклонение факта от плана ({stats['compared_tasks']} задач): "
+            f"{'+' if overrun >= 0 else '−'}{format_duration(int(abs(overrun)))}",
+            f"Средняя энергия — {energy}",
+        ]))
+
+        self.spheres.setRowCount(len(stats["spheres"]))
+        for row, sphere in enumerate(stats["spheres"]):
+            values = (
+                sphere["sphere"],
+                str(sphere["tasks"]),
+                str(sphere["done"]),
+                format_duration(int(sphere["planned_seconds"])),
+                format_duration(int(sphere["actual_seconds"])),
+            )
+            for col, value in enumerate(values):
+                self.spheres.setItem(row, col, QTableWidgetItem(value))
+
+    def keyPressEvent(self, event):
+        if event.key() == Qt.Key_Escape:
+            self.close()
+        else:
+            super().keyPressEvent(event)
@@ -1,22 +1,17 @@
-import sqlite3
-import sys
-from pathlib import Path
-
-from PyQt5.QtWidgets import QWidget, QVBoxLayout, QLabel, QHBoxLayout, QPushButton, QCalendarWidget, QMessageBox
-from PyQt5.QtCore import Qt, QObject, QEvent
-from Widgets import TaskTable
-from database import save_table_data, load_table_data
-
-
-if getattr(sys, 'frozen', False):
-    application_path = Path(sys.executable).parent
-else:
-    application_path = Path(__file__).parent
-
-DB_FILE = application_path / "tasks.db"
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QMessageBox, QShortcut, QFileDialog
+from PyQt5.QtCore import Qt, QObject, QEvent, QDate, pyqtSignal
+from PyQt5.QtGui import QKeySequence
+from Widgets import DayWindow, HeatMapCalendar, SearchPanel, ProfilerOverlay
+from autosave import AutosaveWorker
+from loader import DayLoader
+from database import clear_table_data, day_cache, fetch_day
+from history import History, DayHistory
+import profiling
 
 
 class Central(QObject):
+    autosave_failed = pyqtSignal(str)  # текст ошибки записи из фонового потока автосохранения
+
     def __init__(self, size, color):
         super().__init__()
         self.size = size
@@ -27,122 +22,179 @@ class Central(QObject):
         self.y = size[1]
         self.calendar = None
         self.table_wind = None
+        self.search_panel = None
+        self.stats_window = None
+        self.range_window = None
+        self.autosave = AutosaveWorker(on_error=self.autosave_failed.emit)
+        self.autosave_failed.connect(self.show_autosave_error)
+        self.autosave.start()
+        self.loader = DayLoader(self.autosave)
+        self.loader.rows_loaded.connect(self.append_loaded_rows)
+        self.loader.loading_finished.connect(self.finish_loading)
+        self.loading_request = None
+        self.loading_table = None
+        self.history = History(self.autosave)
         self.initialize_ui()
 
     def initialize_ui(self):
         """Инициализация пользовательского интерфейса"""
         self.window.setWindowFlags(Qt.FramelessWindowHint)
         self.window.resize(self.size[0], self.size[1])
-        self.window.setStyleSheet("background-color: #081436")
 
         layout = QVBoxLayout()
 
-        self.calendar = QCalendarWidget()
-        self.calendar.setStyleSheet(""" 
-            QCalendarWidget {
-                background-color: #081436;
-                color: white;
-                border: 2px solid #0A1A3F;
-                border-radius: 15px;
-                padding: 5px;
-            }
-            QCalendarWidget QWidget {
-                background-color: #0078D7;
-            }
-            QCalendarWidget QMenu {
-                background-color: #0A1A3F;
-                color: white;
-            }
-            QCalendarWidget QAbstractItemView {
-                selection-background-color: #081436;
-                selection-color: white;
-                background-color: #0078D7;
-                gridline-color: #14284A;
-                font-size:25px;
-            }
-            QCalendarWidget QAbstractItemView::disabled {
-                color: #444B6E;
-            }
-        """)
+        self.calendar = HeatMapCalendar()
+        self.calendar.setObjectName("calendar")
+        # Автосохранение пишет из фонового потока, сигнал доставит даты в поток интерфейса
+        self.autosave.on_written = self.calendar.dates_changed.emit
         self.calendar.setFixedSize(self.x - 80, self.y - 80)
         self.calendar.activated.connect(self.show_time_table)
         layout.addWidget(self.calendar, alignment=Qt.AlignCenter)
         self.window.setLayout(layout)
+
+        # Ctrl+F — поиск задач по всем дням, Ctrl+R — статистика за показанный месяц,
+        # Ctrl+W / Ctrl+M — задачи недели выбранной даты и показанного месяца одним списком,
+        # Ctrl+E / Ctrl+I — экспорт и импорт всех задач
+        QShortcut(QKeySequence.Find, self.window, self.show_search)
+        QShortcut(QKeySequence("Ctrl+R"), self.window, self.show_stats)
+        QShortcut(QKeySequence("Ctrl+W"), self.window, lambda: self.show_range("week"))
+        QShortcut(QKeySequence("Ctrl+M"), self.window, lambda: self.show_range("month"))
+        QShortcut(QKeySequence("Ctrl+E"), self.window, self.export_tasks)
+        QShortcut(QKeySequence("Ctrl+I"), self.window, self.import_tasks)
+        if profiling.enabled:
+            # Ctrl+Shift+P — сводка замеров поверх окон
+            self.profiler_overlay = ProfilerOverlay()
+            QShortcut(QKeySequence("Ctrl+Shift+P"), self.window, self.profiler_overlay.toggle)
         self.window.show()
 
+    def show_search(self):
+        """Показать окно поиска задач"""
+        if self.search_panel is None:
+            self.search_panel = SearchPanel()
+            self.search_panel.date_selected.connect(self.open_found_date)
+        self.search_panel.show()
+        self.search_panel.raise_()
+        self.search_panel.activateWindow()
+        self.search_panel.query_edit.setFocus()
+
+    def show_stats(self):
+        """Показать статистику за месяц, открытый в календаре"""
+        # NumPy нужен только здесь, поэтому окно статистики импортируется при первом открытии
+        from StatsWindow import StatsWindow
+        # Статистика читается из БД, поэтому несохранённые правки открытого дня записываются заранее
+        self.save_open_table(wait=True)
+        first = QDate(self.calendar.yearShown(), self.calendar.monthShown(), 1)
+        self.stats_window = StatsWindow(first, first.addMonths(1).addDays(-1))
+        self.stats_window.show()
+
+    def show_range(self, span):
+        """Показать задачи недели выбранной даты или месяца, открытого в календаре"""
+        from RangeWindow import RangeWindow
+        if self.range_window is None:
+            self.range_window = RangeWindow()
+            self.range_window.date_selected.connect(self.open_found_date)
+        # Период читается из БД, поэтому несохранённые правки открытого дня записываются заранее
+        self.save_open_table(wait=True)
+        if span == "week":
+            date = self.calendar.selectedDate()
+        else:
+            date = QDate(self.calendar.yearShown(), self.calendar.monthShown(), 1)
+        self.range_window.show_span(date, span)
+        self.range_window.show()
+        self.range_window.raise_()
+        self.range_window.activateWindow()
+
+    def export_tasks(self):
+        """Выгрузить все задачи в CSV или JSON Lines"""
+        path, _ = QFileDialog.getSaveFileName(self.window, "Экспорт задач", "tasks.csv",
+                                              "CSV (*.csv);;JSON Lines (*.jsonl)")
+        if not path:
+            return
+        from exchange import export_tasks, throughput
+        self.save_open_table(wait=True)
+        try:
+            count, seconds = export_tasks(path)
+        except Exception as e:
+            QMessageBox.warning(self.window, 'Ошибка экспорта', f"Не удалось выгрузить задачи: {e}")
+            return
+        QMessageBox.information(self.window, 'Экспорт завершён', f"Выгружено {throughput(count, seconds)}")
+
+    def import_tasks(self):
+        """Загрузить задачи из CSV или JSON Lines"""
+        path, _ = QFileDialog.getOpenFileName(self.window, "Импорт задач", "",
+                                              "CSV или JSON Lines (*.csv *.jsonl)")
+        if not path:
+            return
+        from exchange import import_tasks, throughput
+        self.save_open_table(wait=True)
+        error = None
+        try:
+            count, seconds = import_tasks(path)
+        except Exception as e:
+            error = e
+        # Даже прерванный импорт мог записать часть строк, поэтому календарь и открытый день перечитываются всегда
+        self.calendar.reload()
+        if self.table_wind is not None and self.table_wind.isVisible():
+            self.show_time_table(QDate.fromString(self.table_wind.table.date_str, "yyyy-MM-dd"))
+        if error is not None:
+            QMessageBox.warning(self.window, 'Ошибка импорта', f"Не удалось загрузить задачи: {error}")
+            return
+        QMessageBox.information(self.window, 'Импорт завершён', f"Загружено {throughput(count, seconds)}")
+
+    def open_found_date(self, date):
+        """Открыть день, выбранный в результатах поиска"""
+        if self.table_wind:
+            self.table_wind.close()
+        self.calendar.setSelectedDate(date)
+        self.show_time_table(date)
+
     def show_time_table(self, date):
         """Показать таблицу задач для выбранной даты"""
-        self.table_wind = QWidget()
-        self.table_wind.installEventFilter(self)
-        self.table_wind.setWindowTitle(f"{date.toString('dd.MM.yyyy')} — Таблица задач")
-        self.table_wind.setStyleSheet("background-color: #081436; color: white; font-size: 20px;")
-        self.table_wind.resize(self.size[0], self.size[1])
-
-        layout = QVBoxLayout()
+        if self.table_wind is None:
+            # Окно дня одно на всё время работы: при выборе другой даты меняются только его данные
+            self.table_wind = DayWindow(self.size)
+            self.table_wind.installEventFilter(self)
+            self.table_wind.transfer_button.clicked.connect(self.transfer_tasks)
+            self.table_wind.clear_button.clicked.connect(self.clear_table)
+            # Ctrl+Z / Ctrl+Y (и Ctrl+Shift+Z) — отмена и повтор изменений дня
+            QShortcut(QKeySequence.Undo, self.table_wind, self.undo)
+            QShortcut(QKeySequence.Redo, self.table_wind, self.redo)
+            QShortcut(QKeySequence("Ctrl+Y"), self.table_wind, self.redo)
         date_str = date.toString("yyyy-MM-dd")
 
-        back_button = QPushButton("Назад (Esc)")
-        back_button.setFixedSize(120, 40)
-        back_button.setStyleSheet(""" 
-            QPushButton {
-                border-radius: 5px;
-                background-color: #0078D7;
-                color: white;
-                font-size: 16px;
-            }
-            QPushButton:hover {
-                background-color: #005bb5;
-            }
-        """)
-        back_button.clicked.connect(self.table_wind.close)
-
-        transfer_button = QPushButton("Перенести задачи ➡️")
-        transfer_button.setFixedSize(180, 40)
-        transfer_button.setStyleSheet(""" 
-                    QPushButton {
-                        border-radius: 5px;
-                        background-color: #0078D7;
-                        color: white;
-                        font-size: 16px;
-                    }
-                    QPushButton:hover {
-                        background-color: #005bb5;
-                    }
-                """)
-        transfer_button.clicked.connect(self.transfer_tasks)
-
-        clear_button = QPushButton("Очистить таблицу")
-        clear_button.setFixedSize(180, 40)
-        clear_button.setStyleSheet("""
-                    QPushButton {
-                        border-radius: 5px;
-                        background-color: #D72A2A;
-                        color: white;
-                        font-size: 16px;
-                    }
-                    QPushButton:hover {
-                        background-color: #D21F1F;
-                    }
-                """)
-        clear_button.clicked.connect(self.clear_table)
-
-        top_bar = QHBoxLayout()
-        top_bar.addWidget(transfer_button, alignment=Qt.AlignLeft)
-        top_bar.addWidget(back_button, alignment=Qt.AlignLeft)
-        top_bar.addWidget(clear_button, alignment=Qt.AlignLeft)
-        top_bar.addStretch()
-        layout.addLayout(top_bar)
-
-        label = QLabel(f"Выбранная дата: {date.toString('dd.MM.yyyy')}")
-        label.setAlignment(Qt.AlignCenter)
-        layout.addWidget(label)
-
-        table = TaskTable(self.size)
-        load_table_data(table, date_str)
-        layout.addWidget(table)
-
-        self.table_wind.setLayout(layout)
+        # Окно показывается сразу: день из кеша выводится целиком, иначе строки подгружаются в фоне порциями
+        self.cancel_loading()
+        table = self.table_wind.table
+        # Правки открытого дня отправляются до чтения кеша: иначе повторный выбор той же даты покажет старый снимок
+        self.table_wind.commit_edits()
+        rows = day_cache.get(date_str)
+        self.table_wind.set_date(date, self.autosave, rows)
+        table.model().history = self.history.day(date_str)
         self.table_wind.show()
+        self.table_wind.raise_()
+
+        if rows is None:
+            self.loading_table = table
+            self.loading_request = self.loader.request(date_str)
+        # Соседние дни читаются заранее: между ними переключаются чаще всего
+        self.loader.prefetch(date.addDays(-1).toString("yyyy-MM-dd"), date.addDays(1).toString("yyyy-MM-dd"))
+
+    def append_loaded_rows(self, request_id, rows):
+        if request_id == self.loading_request:
+            self.loading_table.model().append_rows(rows)
+
+    def finish_loading(self, request_id):
+        if request_id == self.loading_request:
+            self.loading_table.model().finish_loading()
+            self.loading_request = None
+            self.loading_table = None
+
+    def cancel_loading(self):
+        """Прерывает фоновую загрузку дня, если она ещё идёт"""
+        if self.loading_request is not None:
+            self.loader.cancel(self.loading_request)
+            self.loading_request = None
+            self.loading_table = None
 
     def clear_table(self):
         """Очистить данные в таблице и базе данных (оставляя названия колонок)"""
@@ -151,44 +203,67 @@ class Central(QObject):
                                      QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
 
         if reply == QMessageBox.Yes:
+            # Дочитывать день, который сейчас очищается, незачем: порции вернули бы удалённые строки
+            self.cancel_loading()
             # Очистить данные в таблице
-            table = self.table_wind.findChild(TaskTable)
-            if table:
-                # Сохраняем количество строк и колонок
-                row_count = table.rowCount()
-                column_count = table.columnCount()
+            table = self.table_wind.table
+            model = table.model()
+            selected_date = table.date_str
+            # Снимок дня попадает в историю одной командой, отмена вернёт его одной транзакцией.
+            # Снимок читается из БД после записи ожидающих изменений: пока день загружается, в модели только его часть
+            self.save_open_table(wait=True)
+            if model.history is not None:
+                model.history.record_clear([(row, cells) for row, cells in fetch_day(selected_date) if any(cells)])
+            # Очищаем все данные, оставляя одну пустую строку
+            model.clear_rows()
+
+            # Очищаем данные в базе данных
+            self.clear_data_from_db(selected_date)
+            model.mark_clean()
+            self.calendar.refresh_dates({selected_date})
 
-                # Очищаем все данные
-                table.clearContents()
+            QMessageBox.information(self.table_wind, 'Таблица очищена',
+                                    'Таблица задач была очищена!')
 
-                # Восстанавливаем структуру таблицы
-                table.setRowCount(row_count)
-                table.setColumnCount(column_count)
+    def show_autosave_error(self, message):
+        """Сообщить, что изменения пока не записаны (автосохранение повторяет попытки само)"""
+        parent = self.table_wind if self.table_wind is not None and self.table_wind.isVisible() else self.window
+        QMessageBox.warning(parent, 'Ошибка автосохранения',
+                            f"Изменения не удалось записать в базу данных, попытка будет повторена.\n\n{message}")
 
-                # Заполняем пустые ячейки
-                table.fill_empty_cells()
+    def undo(self):
+        """Отменить последнее изменение открытого дня"""
+        self.step_history(DayHistory.undo)
 
-                # Очищаем данные в базе данных
-                selected_date = self.calendar.selectedDate().toString("yyyy-MM-dd")
-                self.clear_data_from_db(selected_date)
+    def redo(self):
+        """Повторить последнее отменённое изменение открытого дня"""
+        self.step_history(DayHistory.redo)
 
-                QMessageBox.information(self.table_wind, 'Таблица очищена',
-                                        'Таблица задач была очищена!')
+    def step_history(self, action):
+        model = self.table_wind.table.model()
+        history = model.history
+        if history is None:
+            return
+        # Очистка и её отмена пишут в БД напрямую, поэтому всё, что ждёт автосохранения, записывается заранее
+        self.save_open_table(wait=True)
+        try:
+            command = action(history, model)
+        except Exception as e:
+            # Ошибка повтора не должна закрывать приложение: о ней сообщается, открытый день остаётся как есть
+            QMessageBox.warning(self.table_wind, 'Ошибка отмены', f"Не удалось применить изменение: {e}")
+            return
+        if command is not None:
+            self.save_open_table(wait=True)
+            self.calendar.refresh_dates({history.date_str})
 
     def clear_data_from_db(self, date_str):
         """Очистить данные таблицы в базе данных по указанной дате"""
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-
-        # Удаляем все записи для указанной даты
-        cursor.execute("DELETE FROM tasks WHERE date = ?", (date_str,))
-        conn.commit()
-        conn.close()
+        clear_table_data(date_str)
 
     def transfer_tasks(self):
         """Show confirmation dialog before transferring tasks inside the table window."""
-        # Get the selected date
-        selected_date = self.calendar.selectedDate().toString("yyyy-MM-dd")
+        # Переносятся задачи дня, открытого в окне: выбор в календаре мог с тех пор смениться
+        selected_date = self.table_wind.table.date_str
 
         # Create the confirmation dialog
         reply = QMessageBox.question(self.table_wind, 'Подтверждение переноса',
@@ -198,22 +273,29 @@ class Central(QObject):
         if reply == QMessageBox.Yes:
             # Proceed with the task transfer
             from database import transfer_unfinished_tasks
+            self.save_open_table(wait=True)
             transfer_unfinished_tasks(selected_date)
+            next_date = QDate.fromString(selected_date, "yyyy-MM-dd").addDays(1)
+            self.calendar.refresh_dates({next_date.toString("yyyy-MM-dd")})
             # Show success message after transfer
             QMessageBox.information(self.table_wind, 'Задачи перенесены', 'Задачи успешно перенесены!')
 
+    def save_open_table(self, wait=False):
+        """Отправляет изменения открытой таблицы в автосохранение и сразу записывает их"""
+        if self.table_wind:
+            self.table_wind.table.push_changes()
+        self.autosave.flush(wait)
+
     def eventFilter(self, obj, event):
         """Обработка событий клавиатуры"""
-        if event.type() == QEvent.KeyPress and event.key() == Qt.Key_Escape:
+        if event.type() == QEvent.Close and obj == self.table_wind:
+            # Любой способ закрыть окно таблицы прерывает загрузку и сохраняет изменения
+            self.cancel_loading()
+            self.save_open_table()
+        elif event.type() == QEvent.KeyPress and event.key() == Qt.Key_Escape:
             if obj == self.window:
                 self.window.close()
             elif obj == self.table_wind:
-                if self.table_wind:  # Если открыта таблица
-                    table = self.table_wind.findChild(TaskTable)
-                    if table:
-                        from database import save_table_data
-                        selected_date = self.calendar.selectedDate().toString("yyyy-MM-dd")
-                        save_table_data(table, selected_date)
                 self.table_wind.close()
             return True
         return super().eventFilter(obj, event)
@@ -1,55 +1,84 @@
 import sys
+import time
 from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout,
-                             QLabel, QPushButton, QHBoxLayout, QTableWidgetItem)
-from PyQt5.QtCore import QTimer, Qt
-from PyQt5.QtGui import QPainter, QColor, QPen, QFont, QBrush
+                             QLabel, QPushButton, QHBoxLayout)
+from PyQt5.QtCore import QTimer, Qt, QPersistentModelIndex, QRect
+from PyQt5.QtGui import QPainter, QFont, QBrush, QPixmap
+
+from database import fetch_day
+from profiling import profiled
+import theme
+
+CIRCLE_DIAMETER = 250
+PEN_WIDTH = 12
+
+
+if hasattr(time, "CLOCK_BOOTTIME"):
+    def clock():
+        """Монотонные секунды, включая время в спящем режиме"""
+        return time.clock_gettime(time.CLOCK_BOOTTIME)
+else:
+    clock = time.monotonic
 
 
 class CircularTimer(QWidget):
     def __init__(self, row=None, table=None):
         super().__init__()
         self.setWindowTitle("Таймер")
+        self.setObjectName("timerWindow")
         self.setFixedSize(400, 450)
         self.row = row
         self.table = table
+        # Индекс ячейки "Время факт" следует за строкой при вставке и удалении строк выше
+        self.index = None
+        self.date_str = None
+        if table is not None and row is not None:
+            self.index = QPersistentModelIndex(table.model().index(row, 4))
+            # Окно дня может переключиться на другую дату, пока идёт таймер: запоминаем, куда писать
+            self.date_str = table.date_str
+            table.model().modelAboutToBeReset.connect(self.remember_row)
+            table.model().rowsAboutToBeRemoved.connect(self.forget_removed_row)
 
         self.max_time = 30  # TODO загрузить в константы
-        self.current_time = 0
+        # Прошедшее время считается по часам, а не по срабатываниям таймера:
+        # накопленное до последней паузы плюс время с последнего старта
+        self.accumulated = 0.0
+        self.started_at = None
+
+        self.background = None
+        self.circle_rect = QRect()
 
         self.init_ui()
 
+        # Таймер только будит окно на границе следующей секунды, чтобы обновить надпись и дугу
         self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setTimerType(Qt.CoarseTimer)
         self.timer.timeout.connect(self.update_timer)
-        self.timer.setInterval(1000)
+
+    @property
+    def elapsed(self):
+        if self.started_at is None:
+            return self.accumulated
+        return self.accumulated + clock() - self.started_at
+
+    @property
+    def current_time(self):
+        return min(int(self.elapsed), self.max_time)
+
+    def schedule_tick(self):
+        delay = 1 - self.elapsed % 1
+        self.timer.start(max(1, int(delay * 1000)))
 
     def init_ui(self):
         """Инициализация интерфейса"""
-        self.setStyleSheet("""
-            background-color: #0A1A3F;
-            color: white;
-        """)
-
         main_layout = QVBoxLayout()
         main_layout.setContentsMargins(30, 30, 30, 30)
         main_layout.setSpacing(20)
 
         # Кнопка завершения на верхней левой части
         self.finish_btn = QPushButton("Завершить")
-        self.finish_btn.setStyleSheet("""
-            QPushButton {
-                background-color: #3399FF;  /* голубой цвет */
-                color: white;
-                border-radius: 5px;
-                padding: 6px 12px;
-                font-size: 14px;
-            }
-            QPushButton:hover {
-                background-color: #1F80D2;
-            }
-            QPushButton:disabled {
-                background-color: #505050;
-            }
-        """)
+        self.finish_btn.setObjectName("finishButton")
         self.finish_btn.setFixedHeight(40)
         self.finish_btn.clicked.connect(self.stop_timer)
 
@@ -61,26 +90,7 @@ class CircularTimer(QWidget):
         self.pause_btn = QPushButton("⏸ Пауза")
         self.reset_btn = QPushButton("↻ Сброс")
 
-        btn_style = """
-            QPushButton {
-                background-color: #0078D7;
-                color: white;
-                border-radius: 5px;
-                padding: 6px 12px;
-                min-width: 80px;
-                font-size: 14px;
-            }
-            QPushButton:hover {
-                background-color: #0095FF;
-            }
-            QPushButton:disabled {
-                background-color: #505050;
-            }
-        """
-
-        # Применяем стиль ко всем кнопкам
         for btn in [self.start_btn, self.pause_btn, self.reset_btn]:
-            btn.setStyleSheet(btn_style)
             btn.setFixedHeight(40)
 
         self.pause_btn.setEnabled(False)
@@ -93,11 +103,10 @@ class CircularTimer(QWidget):
         main_layout.addWidget(self.finish_btn, alignment=Qt.AlignTop | Qt.AlignLeft)  # Переместили сюда кнопку "Завершить"
         main_layout.addStretch(1)  # Оставляем пространство после кнопки
 
-        # Таймер
-        self.time_label = QLabel("00:00:00")
-        self.time_label.setFont(QFont("Arial", 28, QFont.Bold))
+        # Таймер: надпись лежит в центре круга, её положение задаётся в resizeEvent
+        self.time_label = QLabel("00:00:00", self)
+        self.time_label.setFont(theme.font("Arial", 28, QFont.Bold))
         self.time_label.setAlignment(Qt.AlignCenter)
-        main_layout.addWidget(self.time_label)
 
         # Лейаут для остальных кнопок
         btn_layout.addWidget(self.start_btn)
@@ -111,86 +120,111 @@ class CircularTimer(QWidget):
         if self.current_time >= self.max_time:
             return
 
-        self.timer.start()
+        self.started_at = clock()
+        self.schedule_tick()
         self.start_btn.setEnabled(False)
         self.pause_btn.setEnabled(True)
 
     def pause_timer(self):
         self.timer.stop()
+        self.accumulated = self.elapsed
+        self.started_at = None
         self.start_btn.setEnabled(True)
         self.pause_btn.setEnabled(False)
 
     def stop_timer(self):
+        self.timer.stop()
         hours = self.current_time // 3600
         minutes = (self.current_time % 3600) // 60
         seconds = self.current_time % 60
         time_str = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
 
-        if self.table and self.row is not None:
-            existing_item = self.table.item(self.row, 4)
-            if existing_item and existing_item.text().strip():
-                # Если пользователь уже что-то написал вручную — НЕ ПЕРЕЗАПИСЫВАЕМ
-                pass
-            else:
-                # Иначе вставляем наше время
-                if self.table.cellWidget(self.row, 4):
-                    self.table.removeCellWidget(self.row, 4)
-
-                item = QTableWidgetItem(time_str)
-                item.setFlags(item.flags() | Qt.ItemIsEditable)
-                item.setTextAlignment(Qt.AlignCenter)
-                self.table.setItem(self.row, 4, item)
+        # После смены дня в окне индекс недействителен, тогда строка берётся из запомненного номера
+        row = self.index.row() if self.index is not None and self.index.isValid() else self.row
+        model = self.table.model() if self.table is not None else None
+        if model is None or row is None:
+            pass
+        elif self.table.date_str == self.date_str and not model.loading and row < model.rowCount():
+            # Если пользователь уже что-то написал вручную — НЕ ПЕРЕЗАПИСЫВАЕМ, иначе вставляем наше время
+            if not model.text(row, 4).strip():
+                model.set_text(row, 4, time_str)
+        elif self.date_str is not None and self.table.autosave is not None:
+            # Таблица показывает другой день или ещё загружает строки — время записывается через автосохранение
+            self.table.autosave.flush()
+            cells = dict(fetch_day(self.date_str)).get(row)
+            if cells is None or not cells[4].strip():
+                self.table.autosave.submit(self.date_str, [], [(row, 4, time_str)])
 
         self.close()
 
+    def remember_row(self):
+        if self.index is not None and self.index.isValid():
+            self.row = self.index.row()
+
+    def forget_removed_row(self, parent, first, last):
+        # Строку таймера удалили: время записывать некуда
+        if self.index is not None and self.index.isValid() and first <= self.index.row() <= last:
+            self.row = None
+
     def reset_timer(self):
         self.timer.stop()
-        self.current_time = 0
+        self.accumulated = 0.0
+        self.started_at = None
         self.update_display()
         self.start_btn.setEnabled(True)
         self.pause_btn.setEnabled(False)
 
     def update_timer(self):
-        self.current_time += 1
         self.update_display()
 
         if self.current_time >= self.max_time:
-            self.timer.stop()
             self.start_btn.setEnabled(False)
             self.pause_btn.setEnabled(False)
             self.stop_timer()
+        else:
+            self.schedule_tick()
 
     def update_display(self):
         hours = self.current_time // 3600
         minutes = (self.current_time % 3600) // 60
         seconds = self.current_time % 60
         self.time_label.setText(f"{hours:02}:{minutes:02}:{seconds:02}")
-        self.update()
-
+        # Меняется только дуга: перерисовываем квадрат круга с учётом толщины пера
+        margin = PEN_WIDTH // 2 + 1
+        self.update(self.circle_rect.adjusted(-margin, -margin, margin, margin))
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        x = (self.width() - CIRCLE_DIAMETER) // 2
+        y = (self.height() - CIRCLE_DIAMETER) // 2 - 30
+        self.circle_rect = QRect(x, y, CIRCLE_DIAMETER, CIRCLE_DIAMETER)
+        # Полоса по центру круга: уже внутреннего диаметра, чтобы фон надписи не закрывал окружность
+        label_rect = QRect(0, 0, CIRCLE_DIAMETER - 4 * PEN_WIDTH, self.time_label.sizeHint().height())
+        label_rect.moveCenter(self.circle_rect.center())
+        self.time_label.setGeometry(label_rect)
+        self.background = None
+
+    def background_pixmap(self):
+        """Серый круг-подложка, нарисованный один раз на размер окна"""
+        if self.background is None:
+            margin = PEN_WIDTH // 2 + 1
+            ratio = self.devicePixelRatioF()
+            size = CIRCLE_DIAMETER + 2 * margin
+            self.background = QPixmap(int(size * ratio), int(size * ratio))
+            self.background.setDevicePixelRatio(ratio)
+            self.background.fill(Qt.transparent)
+            painter = QPainter(self.background)
+            painter.setRenderHint(QPainter.Antialiasing)
+            painter.setPen(theme.pen(theme.TRACK, PEN_WIDTH))
+            painter.drawEllipse(QRect(margin, margin, CIRCLE_DIAMETER, CIRCLE_DIAMETER))
+            painter.end()
+        return self.background
+
+    @profiled("paint.timer")
     def paintEvent(self, event):
         painter = QPainter(self)
-        painter.setRenderHint(QPainter.Antialiasing)
-
-        # Настройки окружности
-        circle_diameter = 250
-        x = (self.width() - circle_diameter) // 2
-        y = (self.height() - circle_diameter) // 2 - 30
-
-        circle_rect = self.rect().adjusted(
-            x, y,
-            -(self.width() - circle_diameter - x),
-            -(self.height() - circle_diameter - y)
-        )
-
-        # Настройки для обводки
-        pen_width = 12
-        bg_pen = QPen(QColor("#404040"), pen_width)  # Цвет фона окружности
-        progress_pen = QPen(QColor("#0078D7"), pen_width)  # Цвет прогресса
-        progress_pen.setCapStyle(Qt.RoundCap)
-
-        # Рисуем задний круг
-        painter.setPen(bg_pen)
-        painter.drawEllipse(circle_rect)
+        margin = PEN_WIDTH // 2 + 1
+        painter.drawPixmap(self.circle_rect.x() - margin, self.circle_rect.y() - margin, self.background_pixmap())
 
         if self.current_time > 0:
             # Вычисляем прогресс
@@ -198,10 +232,6 @@ class CircularTimer(QWidget):
             angle = int(360 * progress)
 
             # Рисуем прогресс
-            painter.setPen(progress_pen)
-            painter.drawArc(circle_rect, 90 * 16, -angle * 16)  # От 90 градусов, и с углом по часовой стрелке
-
-        # Рисуем текст в центре круга
-        label_x = circle_rect.center().x() - self.time_label.width() // 2
-        label_y = circle_rect.center().y() - self.time_label.height() // 2
-        self.time_label.move(label_x, label_y)
+            painter.setRenderHint(QPainter.Antialiasing)
+            painter.setPen(theme.pen(theme.ACCENT, PEN_WIDTH, Qt.RoundCap))
+            painter.drawArc(self.circle_rect, 90 * 16, -angle * 16)  # От 90 градусов, и с углом по часовой стрелке
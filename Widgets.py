@@ -1,45 +1,118 @@
-import sqlite3
-from datetime import datetime, timedelta
-from pathlib import Path
-import sys
 from PyQt5.QtWidgets import QWidget, QHeaderView, QSizePolicy, QStyledItemDelegate, QStyleOptionViewItem, QStyle, \
-    QAbstractItemDelegate, QApplication, QTextEdit, QPushButton, QCheckBox, QHBoxLayout, QVBoxLayout, QMessageBox, \
-    QAbstractItemView
-from PyQt5.QtCore import QTimer, Qt, QSize, QRectF
+    QApplication, QTextEdit, QPushButton, QHBoxLayout, QVBoxLayout, QAbstractItemView, QCalendarWidget, QLineEdit, \
+    QListWidget, QListWidgetItem, QLabel, QTableView
+from PyQt5.QtCore import QTimer, Qt, QSize, QRect, QRectF, QAbstractTableModel, QModelIndex, QEvent, pyqtSignal, \
+    QObject, QDate, QElapsedTimer
 from PyQt5.QtGui import QPainter, QPen, QColor, QTextDocument, QAbstractTextDocumentLayout, QTextOption, QCursor, \
     QPalette, QKeySequence
+from PyQt5 import sip
+from contextlib import nullcontext
+import csv
+import io
 import math
-from PyQt5.QtWidgets import QTableWidget, QTableWidgetItem
-from PyQt5.uic.properties import QtGui, QtCore
+from collections import OrderedDict
 
-from TimerWindow import CircularTimer
+from database import DONE_COLUMN, DONE_TEXT, is_done, day_stats, day_stats_for, search_tasks
+import profiling
+from profiling import profiled
+import theme
+
+
+def tsv_field(text):
+    """Поле TSV в кавычках, если в тексте есть табуляция, перевод строки или кавычка (как у Excel)"""
+    if "\t" in text or "\n" in text or '"' in text:
+        return '"' + text.replace('"', '""') + '"'
+    return text
+
+
+def parse_tsv(text):
+    """Разбирает блок TSV из буфера обмена в список строк со списками текстов"""
+    return list(csv.reader(io.StringIO(text), dialect="excel-tab"))
+
+
+class AnimationClock(QObject):
+    """Один таймер на все анимированные виджеты; стоит, пока анимировать нечего"""
+    interval = 16  # мс, примерно один кадр
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.widgets = []
+        self.ticks = 0
+        self.elapsed = QElapsedTimer()
+        self.elapsed.start()
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.tick)
+
+    def register(self, widget):
+        if widget not in self.widgets:
+            self.widgets.append(widget)
+        if not self.timer.isActive():
+            self.timer.start(self.interval)
+
+    def unregister(self, widget):
+        if widget in self.widgets:
+            self.widgets.remove(widget)
+        if not self.widgets:
+            self.timer.stop()
+
+    def tick(self):
+        self.ticks += 1
+        seconds = self.elapsed.elapsed() / 1000
+        for widget in list(self.widgets):
+            if sip.isdeleted(widget):
+                self.unregister(widget)
+            else:
+                widget.animate(seconds)
+
+
+_animation_clock = None
+
+
+def animation_clock():
+    """Общие для приложения часы анимации (создаются при первом обращении)"""
+    global _animation_clock
+    if _animation_clock is None:
+        _animation_clock = AnimationClock()
+    return _animation_clock
 
 
 class Line(QWidget):
-    def __init__(self, width, length, color, isshine, parent=None):
+    # Скорость переливания: прежние 0.02 рад за кадр в 16 мс
+    shine_speed = 0.02 * 1000 / AnimationClock.interval
+
+    def __init__(self, width, length, color, isshine, parent=None, coord=None):
         super().__init__(parent)
 
         self.width = width
         self.length = length
         self.color = color
+        self.coord = coord if coord is not None else (0, width // 2)
         self.current_color = QColor(0, 0, 0)
         self.isshine = isshine
-        self.time = 0
+        self.started = None
 
-        self.timer = QTimer(self)
-        self.timer.timeout.connect(self.update_line)
-        self.timer.start(16)
-
-    def update_line(self):
+    def showEvent(self, event):
+        # Кадры нужны только переливающейся линии и только пока она видна:
+        # сворачивание окна тоже приходит сюда как hideEvent/showEvent
+        super().showEvent(event)
         if self.isshine:
-            self.time += 0.02
-            variation = int((math.sin(self.time) * 50) + 105)
-            r = 0
-            g = max(0, min(255, variation))
-            b = max(0, min(255, variation + 100))
-            self.current_color = QColor(r, g, b)
-        self.update()
+            animation_clock().register(self)
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        animation_clock().unregister(self)
+
+    def animate(self, seconds):
+        if self.started is None:
+            self.started = seconds
+        variation = int((math.sin((seconds - self.started) * self.shine_speed) * 50) + 105)
+        color = QColor(0, max(0, min(255, variation)), max(0, min(255, variation + 100)))
+        # Перерисовываем только при смене цвета
+        if color != self.current_color:
+            self.current_color = color
+            self.update()
 
+    @profiled("paint.line")
     def paintEvent(self, event):
         painter = QPainter(self)
         pen = QPen(self.current_color)
@@ -65,21 +138,59 @@ class WordWrapTextEdit(QTextEdit):
         return QSize(super().sizeHint().width(), int(height) + 5)
 
 
+class TextLayoutCache:
+    """Ограниченный LRU-кеш свёрстанных QTextDocument по ключу (текст, ширина, выделение)"""
+
+    def __init__(self, capacity=2048):
+        self.capacity = capacity
+        self._documents = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def document(self, text, width, selected=False):
+        key = (text, width, selected)
+        doc = self._documents.get(key)
+        if doc is not None:
+            self._documents.move_to_end(key)
+            self.hits += 1
+            return doc
+
+        self.misses += 1
+        doc = QTextDocument()
+        doc.setHtml(f"<span style='color:#0078D7;'>{text}</span>")
+        doc.setTextWidth(width)
+        self._documents[key] = doc
+        if len(self._documents) > self.capacity:
+            self._documents.popitem(last=False)
+        return doc
+
+    def invalidate_text(self, text):
+        """Убирает все вёрстки для текста (после редактирования ячейки он может больше не встречаться)"""
+        for key in [key for key in self._documents if key[0] == text]:
+            del self._documents[key]
+
+    def clear(self):
+        self._documents.clear()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
 class WordWrapDelegate(QStyledItemDelegate):
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, layout_cache=None):
         super().__init__(parent)
         self.editor = None
+        self.layout_cache = layout_cache if layout_cache is not None else TextLayoutCache()
 
     def createEditor(self, parent, option, index):
         self.editor = WordWrapTextEdit(parent)
-        self.editor.setStyleSheet("""
-            QTextEdit {
-                font-size: 20px;
-                border: 2px solid #0078D7;
-                padding: 2px;
-                color: #0078D7;
-            }
-        """)
+        self.editor.setObjectName("cellEditor")
         self.editor.textChanged.connect(lambda: self.adjustEditorSize(self.editor))
         return self.editor
 
@@ -91,6 +202,7 @@ class WordWrapDelegate(QStyledItemDelegate):
         editor.setPlainText(value)
 
     def setModelData(self, editor, model, index):
+        self.layout_cache.invalidate_text(model.data(index, Qt.EditRole))
         model.setData(index, editor.toPlainText(), Qt.EditRole)
 
     def updateEditorGeometry(self, editor, option, index):
@@ -101,6 +213,7 @@ class WordWrapDelegate(QStyledItemDelegate):
         editor.setGeometry(option.rect)
         self.adjustEditorSize(editor)
 
+    @profiled("paint.text_cell")
     def paint(self, painter, option, index):
         options = QStyleOptionViewItem(option)
         self.initStyleOption(options, index)
@@ -111,10 +224,9 @@ class WordWrapDelegate(QStyledItemDelegate):
         if options.state & QStyle.State_Selected:
             painter.fillRect(option.rect, option.palette.highlight())
 
-        # Рисуем текст
-        doc = QTextDocument()
-        doc.setHtml(f"<span style='color:#0078D7;'>{options.text}</span>")
-        doc.setTextWidth(option.rect.width())
+        # Рисуем текст (вёрстка берётся из кеша)
+        selected = bool(options.state & QStyle.State_Selected)
+        doc = self.layout_cache.document(options.text, option.rect.width(), selected)
 
         textRect = option.widget.style().subElementRect(QStyle.SE_ItemViewItemText, options)
         painter.translate(textRect.left(), textRect.top())
@@ -132,40 +244,485 @@ class WordWrapDelegate(QStyledItemDelegate):
 
         painter.restore()
 
+    @profiled("layout.size_hint")
     def sizeHint(self, option, index):
         options = QStyleOptionViewItem(option)
         self.initStyleOption(options, index)
 
-        doc = QTextDocument()
-        doc.setHtml(options.text)
-        doc.setTextWidth(option.rect.width())
+        doc = self.layout_cache.document(options.text, option.rect.width())
 
         height = doc.size().height()
         min_height = 30
         return QSize(int(doc.idealWidth()), max(int(height), min_height))
 
 
-class TaskTable(QTableWidget):
+class DoneCheckDelegate(QStyledItemDelegate):
+    """Рисует флажок "Сделано" и переключает его по клику без отдельного виджета в ячейке"""
+    indicator_size = 18
+    border_color = theme.color(theme.ACCENT)
+    unchecked_color = theme.color("#ffffff")
+    border_pen = theme.pen(theme.ACCENT, 2)
+
+    def indicator_rect(self, option):
+        rect = QRect(0, 0, self.indicator_size, self.indicator_size)
+        rect.moveCenter(option.rect.center())
+        return rect
+
+    @profiled("paint.done_cell")
+    def paint(self, painter, option, index):
+        painter.save()
+        if option.state & QStyle.State_Selected:
+            painter.fillRect(option.rect, option.palette.highlight())
+
+        checked = index.data(Qt.CheckStateRole) == Qt.Checked
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setPen(self.border_pen)
+        painter.setBrush(self.border_color if checked else self.unchecked_color)
+        painter.drawRoundedRect(QRectF(self.indicator_rect(option)).adjusted(1, 1, -1, -1), 3, 3)
+        painter.restore()
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() == QEvent.MouseButtonRelease and event.button() == Qt.LeftButton:
+            if not option.rect.contains(event.pos()):
+                return False
+        elif event.type() in (QEvent.MouseButtonPress, QEvent.MouseButtonDblClick):
+            return event.button() == Qt.LeftButton
+        elif not (event.type() == QEvent.KeyPress and event.key() in (Qt.Key_Space, Qt.Key_Select)):
+            return False
+
+        checked = index.data(Qt.CheckStateRole) == Qt.Checked
+        return model.setData(index, Qt.Unchecked if checked else Qt.Checked, Qt.CheckStateRole)
+
+    def sizeHint(self, option, index):
+        return QSize(30, 30)
+
+
+class TimerButtonDelegate(QStyledItemDelegate):
+    """Рисует кнопку "Старт" в пустой ячейке "Время факт" и сообщает о её нажатии"""
+    start_requested = pyqtSignal(int)
+
+    button_color = theme.color(theme.ACCENT)
+    hover_color = theme.color(theme.ACCENT_LIGHT)
+    text_color = theme.color(theme.TEXT)
+
+    @profiled("paint.timer_cell")
+    def paint(self, painter, option, index):
+        if index.data(Qt.EditRole):
+            super().paint(painter, option, index)
+            return
+
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(self.hover_color if option.state & QStyle.State_MouseOver else self.button_color)
+        painter.drawRoundedRect(QRectF(option.rect).adjusted(1, 1, -1, -1), 3, 3)
+
+        painter.setFont(theme.pixel_font(option.font, 14))
+        painter.setPen(self.text_color)
+        painter.drawText(option.rect, Qt.AlignCenter, "Старт")
+        painter.restore()
+
+    def editorEvent(self, event, model, option, index):
+        if index.data(Qt.EditRole):
+            return super().editorEvent(event, model, option, index)
+
+        # Клики по пустой ячейке — это нажатия кнопки, а не начало редактирования
+        if event.type() in (QEvent.MouseButtonPress, QEvent.MouseButtonDblClick):
+            return event.button() == Qt.LeftButton
+        if event.type() == QEvent.MouseButtonRelease and event.button() == Qt.LeftButton:
+            if option.rect.contains(event.pos()):
+                self.start_requested.emit(index.row())
+            return True
+        return False
+
+    def sizeHint(self, option, index):
+        size = super().sizeHint(option, index)
+        return QSize(size.width(), max(size.height(), 30))
+
+
+HEADERS = [
+    "Сфера деятельности",
+    "Название задачи",
+    "Продукт",
+    "Время пот",
+    "Время факт",
+    "Сделано",
+    "Творческая",
+    "Умственная",
+    "Физическая",
+    "Восполнение"
+]
+TIMER_COLUMN = 4
+
+
+class TaskTableModel(QAbstractTableModel):
+    """Модель таблицы задач: данные хранятся по колонкам и отдаются представлению по запросу"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        # Тексты ячеек по колонкам, колонка "Сделано" — массив флагов
+        self._columns = self._empty_columns(1)
+
+        # Изменённые ячейки и структурные операции над строками с момента последнего сохранения
+        self.dirty_cells = set()
+        self.row_ops = []
+        self.loading = False
+        # История отмены открытого дня (history.DayHistory), если она подключена
+        self.history = None
+
+    @staticmethod
+    def _empty_columns(row_count):
+        return [bytearray(row_count) if col == DONE_COLUMN else [""] * row_count
+                for col in range(len(HEADERS))]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._columns[0])
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return HEADERS[section]
+        return section + 1
+
+    def flags(self, index):
+        if self.loading:
+            return Qt.ItemIsEnabled | Qt.ItemIsSelectable
+        if index.column() == DONE_COLUMN:
+            return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsUserCheckable
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsEditable
+
+    def data(self, index, role=Qt.DisplayRole):
+        row, col = index.row(), index.column()
+        if col == DONE_COLUMN:
+            if role == Qt.CheckStateRole:
+                return Qt.Checked if self._columns[col][row] else Qt.Unchecked
+            return None
+        if role == Qt.DisplayRole or role == Qt.EditRole:
+            return self._columns[col][row]
+        if role == Qt.TextAlignmentRole:
+            if col == TIMER_COLUMN:
+                return Qt.AlignCenter
+            return Qt.AlignTop | Qt.AlignLeft
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if self.loading:
+            return False
+        row, col = index.row(), index.column()
+        old = self.text(row, col)
+        if col == DONE_COLUMN:
+            if role != Qt.CheckStateRole:
+                return False
+            self._columns[col][row] = value == Qt.Checked
+        elif role == Qt.EditRole:
+            self._columns[col][row] = value
+        else:
+            return False
+        self.dirty_cells.add((row, col))
+        if self.history is not None and old != self.text(row, col):
+            self.history.record_cell(row, col, old, self.text(row, col))
+        self.dataChanged.emit(index, index, [role])
+        return True
+
+    def text(self, row, col):
+        """Текст ячейки в том виде, в котором он хранится в БД"""
+        if col == DONE_COLUMN:
+            return DONE_TEXT if self._columns[col][row] else ""
+        return self._columns[col][row]
+
+    def set_text(self, row, col, text):
+        if col == DONE_COLUMN:
+            return self.setData(self.index(row, col), Qt.Checked if is_done(text) else Qt.Unchecked,
+                                Qt.CheckStateRole)
+        return self.setData(self.index(row, col), text)
+
+    def snapshot(self):
+        """Непустые строки модели [(номер строки, [тексты ячеек])]"""
+        return [(row, [self.text(row, col) for col in range(len(HEADERS))])
+                for row in range(self.rowCount()) if self.row_has_text(row)]
+
+    def set_cells(self, cells):
+        """Записывает пачку [(row, col, text)] с одним сигналом dataChanged на охватывающий прямоугольник"""
+        if self.loading or not cells:
+            return
+        top, left, bottom, right = self.rowCount(), self.columnCount(), -1, -1
+        for row, col, text in cells:
+            old = self.text(row, col)
+            if col == DONE_COLUMN:
+                self._columns[col][row] = is_done(text)
+            else:
+                self._columns[col][row] = text
+            self.dirty_cells.add((row, col))
+            if self.history is not None:
+                new = self.text(row, col)
+                if old != new:
+                    self.history.record_cell(row, col, old, new)
+            top, left, bottom, right = min(top, row), min(left, col), max(bottom, row), max(right, col)
+        self.dataChanged.emit(self.index(top, left), self.index(bottom, right), [Qt.EditRole])
+
+    def paste(self, top, left, block):
+        """Вставляет блок текстов [[...], ...] начиная с ячейки (top, left) одной командой истории.
+
+        Недостающие строки добавляются одной вставкой, столбцы пишутся срезами,
+        изменения приходят представлению одним dataChanged.
+        """
+        if self.loading or not block:
+            return
+        bottom = top + len(block) - 1
+        right = min(left + max(map(len, block)), self.columnCount()) - 1
+        missing = bottom + 1 - self.rowCount()
+        if missing > 0:
+            first = self.rowCount()
+            self.beginInsertRows(QModelIndex(), first, bottom)
+            for col, values in enumerate(self._columns):
+                values.extend(bytes(missing) if col == DONE_COLUMN else [""] * missing)
+            self.endInsertRows()
+
+        rectangular = all(len(texts) > right - left for texts in block)
+        record = self.history.record_cell if self.history is not None else None
+        with self.history.group("Вставка из буфера") if record else nullcontext():
+            for col in range(left, right + 1):
+                offset = col - left
+                values = self._columns[col]
+                old = values[top:bottom + 1]
+                # Короткие строки блока не трогают ячейки правее своего конца
+                if col == DONE_COLUMN:
+                    new = bytearray(is_done(texts[offset]) if offset < len(texts) else value
+                                    for texts, value in zip(block, old))
+                elif rectangular:
+                    new = [texts[offset] for texts in block]
+                else:
+                    new = [texts[offset] if offset < len(texts) else value for texts, value in zip(block, old)]
+                changed = [i for i, (before, after) in enumerate(zip(old, new)) if before != after]
+                if not changed:
+                    continue
+                values[top:bottom + 1] = new
+                self.dirty_cells.update((top + i, col) for i in changed)
+                if record:
+                    for i in changed:
+                        if col == DONE_COLUMN:
+                            record(top + i, col, DONE_TEXT if old[i] else "", DONE_TEXT if new[i] else "")
+                        else:
+                            record(top + i, col, old[i], new[i])
+        self.dataChanged.emit(self.index(top, left), self.index(bottom, right), [Qt.EditRole])
+
+    def tsv(self, top, left, bottom, right):
+        """Строки TSV для прямоугольника ячеек (без завершающих переводов строк)"""
+        columns = []
+        for col in range(left, right + 1):
+            values = self._columns[col][top:bottom + 1]
+            columns.append([DONE_TEXT if flag else "" for flag in values] if col == DONE_COLUMN else values)
+        tabs = right - left
+        lines = []
+        for texts in zip(*columns):
+            line = "\t".join(texts)
+            # Кавычки нужны редко: проверяем строку целиком и только тогда разбираем поля
+            if '"' in line or "\n" in line or line.count("\t") != tabs:
+                line = "\t".join(map(tsv_field, texts))
+            lines.append(line)
+        return lines
+
+    def row_has_text(self, row):
+        return any(self._columns[col][row] for col in range(len(HEADERS)))
+
+    @staticmethod
+    def _fill_columns(columns, rows):
+        done = columns[DONE_COLUMN]
+        for row, cells in rows:
+            for col, text in enumerate(cells):
+                if col == DONE_COLUMN:
+                    done[row] = is_done(text)
+                else:
+                    columns[col][row] = text
+
+    @profiled("table.load_rows")
+    def load_rows(self, rows):
+        """Заполняет модель строками [(номер строки, [тексты ячеек])] за один сброс"""
+        row_count = 1
+        if rows:
+            # Последняя строка таблицы всегда остаётся пустой для ввода новой задачи
+            last_row, last_cells = rows[-1]
+            row_count = last_row + 1 + any(last_cells)
+
+        columns = self._empty_columns(row_count)
+        self._fill_columns(columns, rows)
+
+        self.beginResetModel()
+        self._columns = columns
+        self.loading = False
+        self.endResetModel()
+        self.mark_clean()
+
+    def start_loading(self):
+        """Очищает модель перед потоковой загрузкой; до finish_loading она только для чтения"""
+        self.beginResetModel()
+        self._columns = self._empty_columns(0)
+        self.loading = True
+        self.endResetModel()
+
+    @profiled("table.append_rows")
+    def append_rows(self, rows):
+        """Дописывает в конец очередную порцию строк [(номер строки, [тексты ячеек])]"""
+        if not rows:
+            return
+        first, row_count = self.rowCount(), rows[-1][0] + 1
+        self.beginInsertRows(QModelIndex(), first, row_count - 1)
+        for col, values in enumerate(self._columns):
+            values.extend(bytes(row_count - first) if col == DONE_COLUMN else [""] * (row_count - first))
+        self._fill_columns(self._columns, rows)
+        self.endInsertRows()
+
+    def finish_loading(self):
+        self.loading = False
+        if self.rowCount() == 0 or self.row_has_text(self.rowCount() - 1):
+            self.insert_row(self.rowCount(), record=False)
+        self.mark_clean()
+
+    def clear_rows(self):
+        """Очищает все данные, оставляя одну пустую строку"""
+        self.beginResetModel()
+        self._columns = self._empty_columns(1)
+        self.loading = False
+        self.endResetModel()
+
+    def insert_row(self, row, record=True):
+        self.beginInsertRows(QModelIndex(), row, row)
+        for col, values in enumerate(self._columns):
+            if col == DONE_COLUMN:
+                values[row:row] = b"\0"
+            else:
+                values.insert(row, "")
+        self.endInsertRows()
+        if record:
+            self.record_row_insert(row)
+            if self.history is not None:
+                self.history.record_insert(row)
+
+    def remove_row(self, row):
+        if self.history is not None:
+            self.history.record_delete(row, [self.text(row, col) for col in range(len(HEADERS))])
+        self.beginRemoveRows(QModelIndex(), row, row)
+        for values in self._columns:
+            del values[row]
+        self.endRemoveRows()
+        self.record_row_delete(row)
+
+    def record_row_insert(self, row):
+        """Запоминает вставку строки и сдвигает индексы изменённых ячеек ниже неё"""
+        self.row_ops.append(("insert", row))
+        self.dirty_cells = {(r + 1 if r >= row else r, c) for r, c in self.dirty_cells}
+
+    def record_row_delete(self, row):
+        """Запоминает удаление строки и сдвигает индексы изменённых ячеек ниже неё"""
+        self.row_ops.append(("delete", row))
+        self.dirty_cells = {(r - 1 if r > row else r, c) for r, c in self.dirty_cells if r != row}
+
+    def mark_clean(self):
+        self.dirty_cells.clear()
+        self.row_ops.clear()
+
+    def take_changes(self):
+        """Возвращает (операции над строками, [(row, col, content)]) и сбрасывает отслеживание"""
+        cells = [(row, col, self.text(row, col)) for row, col in sorted(self.dirty_cells)]
+        row_ops = list(self.row_ops)
+        self.mark_clean()
+        return row_ops, cells
+
+
+class RowHeightEngine(QObject):
+    """Высоты строк таблицы: пересчитываются только у изменённых строк и только когда они видны"""
+    minimum_height = 30
+
+    def __init__(self, table):
+        super().__init__(table)
+        self.table = table
+        # 1 — высота строки посчитана для текущего содержимого и ширины колонок
+        self._valid = bytearray(table.model().rowCount())
+        self._scheduled = False
+        self.measured_rows = 0
+
+        model = table.model()
+        model.dataChanged.connect(self.invalidate_range)
+        model.rowsInserted.connect(self.rows_inserted)
+        model.rowsRemoved.connect(self.rows_removed)
+        model.modelReset.connect(self.invalidate_all)
+        table.horizontalHeader().sectionResized.connect(self.invalidate_all)
+        table.verticalScrollBar().valueChanged.connect(self.schedule)
+
+        header = table.verticalHeader()
+        header.setSectionResizeMode(QHeaderView.Fixed)
+        header.setDefaultSectionSize(self.minimum_height)
+
+    def invalidate_range(self, top_left, bottom_right, roles=()):
+        for row in range(top_left.row(), bottom_right.row() + 1):
+            self._valid[row] = 0
+        self.schedule()
+
+    def rows_inserted(self, parent, first, last):
+        self._valid[first:first] = bytes(last - first + 1)
+        self.schedule()
+
+    def rows_removed(self, parent, first, last):
+        del self._valid[first:last + 1]
+        self.schedule()
+
+    def invalidate_all(self, *args):
+        self._valid = bytearray(self.table.model().rowCount())
+        self.schedule()
+
+    def schedule(self, *args):
+        if not self._scheduled:
+            self._scheduled = True
+            QTimer.singleShot(0, self.update_visible)
+
+    def visible_rows(self):
+        table = self.table
+        row_count = table.model().rowCount()
+        first = table.rowAt(0)
+        if first < 0:
+            return range(0)
+        last = table.rowAt(table.viewport().height() - 1)
+        return range(first, (last if last >= 0 else row_count - 1) + 1)
+
+    @profiled("layout.row_heights")
+    def update_visible(self):
+        """Измеряет устаревшие строки в видимой области, пока она не перестанет меняться"""
+        self._scheduled = False
+        header = self.table.verticalHeader()
+        while True:
+            stale = [row for row in self.visible_rows() if not self._valid[row]]
+            if not stale:
+                break
+            for row in stale:
+                self._valid[row] = 1
+                height = self.measure(row)
+                if header.sectionSize(row) != height:
+                    header.resizeSection(row, height)
+
+    def measure(self, row):
+        table = self.table
+        model = table.model()
+        option = table.viewOptions()
+        height = self.minimum_height
+        for col in range(model.columnCount()):
+            if not model.text(row, col):
+                continue
+            index = model.index(row, col)
+            option.rect = QRect(0, 0, table.columnWidth(col), height)
+            height = max(height, table.itemDelegate(index).sizeHint(option, index).height())
+        self.measured_rows += 1
+        return height
+
+
+class TaskTable(QTableView):
     def __init__(self, size, parent=None):
         super().__init__(parent)
         self.size = size
-
-        headers = [
-            "Сфера деятельности",
-            "Название задачи",
-            "Продукт",
-            "Время пот",
-            "Время факт",
-            "Сделано",
-            "Творческая",
-            "Умственная",
-            "Физическая",
-            "Восполнение"
-        ]
-
-        self.setColumnCount(len(headers))
-        self.setHorizontalHeaderLabels(headers)
-        self.setRowCount(1)
+        self.setModel(TaskTableModel(self))
 
         header = self.horizontalHeader()
         header.setSectionResizeMode(QHeaderView.Stretch)
@@ -173,200 +730,366 @@ class TaskTable(QTableWidget):
         self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
         self.setSelectionMode(QAbstractItemView.ExtendedSelection)
         self.setSelectionBehavior(QAbstractItemView.SelectItems)
-        self.setStyleSheet("""
-            QHeaderView::section {
-                background-color: #0078D7;
-                color: white;
-                padding: 5px;
-                font-size: 16px;
-                border: 1px solid #0A1A3F;
-            }
-            QTableWidget {
-                gridline-color: #0078D7;
-                font-size: 14px;
-                selection-background-color: #3399FF;  /* добавлено: яркий фон выделения */
-                selection-color: white;                /* добавлено: текст внутри выделения */
-            }
-            QTableWidget QTableCornerButton::section {
-                background-color: #0078D7;
-                border: 1px solid #0A1A3F;
-            }
-        """)
-
-        self.verticalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
-        self.cellChanged.connect(self.check_last_row_input)
-        self.verticalHeader().sectionClicked.connect(self.show_row_menu)
+        self.setObjectName("taskTable")
 
-        self.fill_empty_cells()
+        self.model().dataChanged.connect(self.check_last_row_input)
+        self.verticalHeader().sectionClicked.connect(self.show_row_menu)
+        self.setMouseTracking(True)
+        self.viewport().setAttribute(Qt.WA_Hover)
 
+        # Общий для всех текстовых колонок кеш вёрстки; при изменении ширины колонок он устаревает
+        self.layout_cache = TextLayoutCache()
+        header.sectionResized.connect(self.layout_cache.clear)
+        if profiling.enabled:
+            profiling.profiler.gauge("layout_cache.hit_rate", lambda: self.layout_cache.hit_rate)
         for col in range(self.columnCount()):
-            if col != 4 and col != 5 and col != 10:
-                delegate = WordWrapDelegate(self)
+            if col != TIMER_COLUMN and col != DONE_COLUMN:
+                delegate = WordWrapDelegate(self, self.layout_cache)
                 self.setItemDelegateForColumn(col, delegate)
 
+        # Высоты строк считаются лениво вместо ResizeToContents по всей таблице
+        self.row_heights = RowHeightEngine(self)
+
+        # Изменения уходят в фоновое автосохранение раз за проход цикла событий
+        self.autosave = None
+        self.date_str = None
+        self._push_scheduled = False
+        model = self.model()
+        model.dataChanged.connect(self.schedule_push)
+        model.rowsInserted.connect(self.schedule_push)
+        model.rowsRemoved.connect(self.schedule_push)
+
+        timer_delegate = TimerButtonDelegate(self)
+        timer_delegate.start_requested.connect(lambda row: self.start_timer_for_row(row, TIMER_COLUMN))
+        self.setItemDelegateForColumn(TIMER_COLUMN, timer_delegate)
+        self.setItemDelegateForColumn(DONE_COLUMN, DoneCheckDelegate(self))
+
+    def rowCount(self):
+        return self.model().rowCount()
+
+    if profiling.enabled:
+        # Перехват кадров нужен только при замерах, иначе отрисовка идёт напрямую в QTableView
+        @profiling.frame("frame.task_table")
+        def paintEvent(self, event):
+            super().paintEvent(event)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.row_heights.schedule()
+
+    def bind_autosave(self, worker, date_str):
+        """Подключает таблицу к фоновому автосохранению изменений за указанную дату"""
+        self.autosave = worker
+        self.date_str = date_str
+
+    def schedule_push(self, *args):
+        if self.autosave is not None and not self._push_scheduled:
+            self._push_scheduled = True
+            QTimer.singleShot(0, self.push_changes)
+
+    def push_changes(self):
+        """Передаёт накопленные изменения в автосохранение"""
+        self._push_scheduled = False
+        if self.autosave is None:
+            return
+        row_ops, cells = self.model().take_changes()
+        if row_ops or cells:
+            self.autosave.submit(self.date_str, row_ops, cells)
+
+    def columnCount(self):
+        return self.model().columnCount()
+
     def show_row_menu(self, row):
         global_pos = QCursor.pos()
         w = QWidget(flags=Qt.Popup)
+        w.setObjectName("rowMenu")
+        w.setAttribute(Qt.WA_DeleteOnClose)
         layout = QHBoxLayout(w)
         add_btn = QPushButton("Добавить строку вниз")
         del_btn = QPushButton("Удалить строку")
         layout.addWidget(add_btn)
         layout.addWidget(del_btn)
-        w.setStyleSheet("""
-              QWidget {
-                  background-color: #0A1A3F;
-              }
-              QPushButton {
-                  background-color: #0078D7;
-                  color: white;
-                  font-size: 14px;
-                  padding: 5px 10px;
-                  border: none;
-                  border-radius: 4px;
-              }
-              QPushButton:hover {
-                  background-color: #3399FF;
-              }
-          """)
         w.move(global_pos)
         w.show()
         add_btn.clicked.connect(lambda: self.add_row_below(row, w))
         del_btn.clicked.connect(lambda: self.delete_row(row, w))
 
-    def create_done_checkbox(self, row, col):
-        checkbox = QCheckBox()
-        checkbox.setStyleSheet("""
-            QCheckBox {
-                spacing: 5px;
-            }
-            QCheckBox::indicator {
-                width: 18px;
-                height: 18px;
-            }
-            QCheckBox::indicator:unchecked {
-                background-color: #ffffff;
-                border: 2px solid #0078D7;
-                border-radius: 3px;
-            }
-            QCheckBox::indicator:checked {
-                background-color: #0078D7;
-                border: 2px solid #0078D7;
-                border-radius: 3px;
-            }
-        """)
-        checkbox.setMinimumSize(30, 30)
-        checkbox.setMaximumSize(30, 30)
-
-        if col == 10:  # Для колонки "Перенести"
-            checkbox.stateChanged.connect(lambda state, r=row: self.transfer_task(r, state))
-
-        container = QWidget()
-        layout = QHBoxLayout(container)
-        layout.addWidget(checkbox)
-        layout.setContentsMargins(0, 0, 0, 0)
-        layout.setAlignment(Qt.AlignCenter)
-        container.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
-
-        return container
-
-
-    def create_timer_button(self, row, col):
-        button = QPushButton("Старт")
-        button.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)  # Вот это ключ
-        button.setStyleSheet("""
-            QPushButton {
-                background-color: #0078D7;
-                color: white;
-                padding: 3px;
-                font-size: 14px;
-                border: none;
-                border-radius: 3px;
-            }
-            QPushButton:hover {
-                background-color: #3399FF;
-            }
-        """)
-        button.setMinimumHeight(30)
-        button.clicked.connect(lambda: self.start_timer_for_row(row, col))
-
-        container = QWidget()
-        layout = QHBoxLayout(container)
-        layout.addWidget(button)
-        layout.setContentsMargins(0, 0, 0, 0)
-        layout.setAlignment(Qt.AlignCenter)
-        container.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)  # И контейнеру тоже
-
-        return container
-
     def start_timer_for_row(self, row, column):
+        # Окно таймера не нужно для показа календаря, поэтому импортируется при первом запуске
+        from TimerWindow import CircularTimer
         self.timer_window = CircularTimer(row=row, table=self)
         self.timer_window.show()
 
     def add_row_below(self, row, parent):
-        self.insertRow(row + 1)
-        for col in range(self.columnCount()):
-            if col == 4:
-                self.setCellWidget(row + 1, col, self.create_timer_button(row + 1, col))
-            elif col == 5:
-                self.setCellWidget(row + 1, col, self.create_done_checkbox(row + 1, col))
-            else:
-                item = QTableWidgetItem("")
-                item.setFlags(item.flags() | Qt.ItemIsEditable)
-                item.setTextAlignment(Qt.AlignTop | Qt.AlignLeft)
-                self.setItem(row + 1, col, item)
+        self.model().insert_row(row + 1)
         parent.close()
 
-    def fill_row(self, row):
-        for col in range(self.columnCount()):
-            if col == 4:
-                self.setCellWidget(row, col, self.create_timer_button(row, col))
-            elif col == 5:
-                self.setCellWidget(row, col, self.create_done_checkbox(row, col))
-            else:
-                item = QTableWidgetItem("")
-                item.setFlags(item.flags() | Qt.ItemIsEditable)
-                item.setTextAlignment(Qt.AlignTop | Qt.AlignLeft)
-                self.setItem(row, col, item)
-
     def delete_row(self, row, parent):
         if self.rowCount() > 1:
-            self.removeRow(row)
+            self.model().remove_row(row)
         parent.close()
 
-    def check_last_row_input(self, row, col):
-        if row == self.rowCount() - 1 and self.item(row, col).text().strip():
-            self.insertRow(self.rowCount())
-            self.fill_row(self.rowCount() - 1)
+    def check_last_row_input(self, top_left, bottom_right):
+        model = self.model()
+        last_row = model.rowCount() - 1
+        if bottom_right.row() == last_row and model.row_has_text(last_row):
+            model.insert_row(last_row + 1, record=False)
 
     def fill_empty_cells(self):
-        for row in range(self.rowCount()):
-            self.fill_row(row)
+        """Гарантирует пустую последнюю строку для ввода новой задачи"""
+        model = self.model()
+        if model.rowCount() == 0 or model.row_has_text(model.rowCount() - 1):
+            model.insert_row(model.rowCount(), record=False)
 
     def keyPressEvent(self, event):
-        # Перехват Ctrl+C
+        # Перехват Ctrl+C и Ctrl+V
         if event.matches(QKeySequence.Copy):
             self.copy_selection()
             event.accept()
+        elif event.matches(QKeySequence.Paste):
+            self.paste_clipboard()
+            event.accept()
         else:
             super().keyPressEvent(event)
 
+    @profiled("table.copy")
     def copy_selection(self):
-        selected_ranges = self.selectedRanges()
+        selected_ranges = self.selectionModel().selection()
         if not selected_ranges:
             return
 
-        copied_text = ""
+        model = self.model()
+        lines = []
         for selected_range in selected_ranges:
-            for row in range(selected_range.topRow(), selected_range.bottomRow() + 1):
-                row_data = []
-                for col in range(selected_range.leftColumn(), selected_range.rightColumn() + 1):
-                    item = self.item(row, col)
-                    row_data.append(item.text() if item else "")
-                copied_text += '\t'.join(row_data) + '\n'
+            lines.extend(model.tsv(selected_range.top(), selected_range.left(),
+                                   selected_range.bottom(), selected_range.right()))
 
         clipboard = QApplication.clipboard()
-        clipboard.setText(copied_text)
+        clipboard.setText("\n".join(lines) + "\n")
 
         # После копирования: принудительно выйти из режима редактирования
         self.clearFocus()
         self.setFocus()
+
+
+    def paste_clipboard(self):
+        text = QApplication.clipboard().text()
+        if text:
+            self.paste_text(text)
+
+    @profiled("table.paste")
+    def paste_text(self, text):
+        """Вставляет блок TSV, начиная с левого верхнего угла выделения (или текущей ячейки)"""
+        block = parse_tsv(text)
+        if not block:
+            return
+        selection = self.selectionModel().selection()
+        if selection:
+            top = min(selected_range.top() for selected_range in selection)
+            left = min(selected_range.left() for selected_range in selection)
+        else:
+            current = self.currentIndex()
+            top, left = max(current.row(), 0), max(current.column(), 0)
+        self.model().paste(top, left, block)
+
+
+class DayWindow(QWidget):
+    """Окно задач одного дня; создаётся один раз и переключается между датами"""
+
+    def __init__(self, size, parent=None):
+        super().__init__(parent)
+        self.setObjectName("dayWindow")
+        self.resize(size[0], size[1])
+        self.date = None
+
+        layout = QVBoxLayout(self)
+
+        self.back_button = QPushButton("Назад (Esc)")
+        self.back_button.setFixedSize(120, 40)
+        self.back_button.clicked.connect(self.close)
+
+        self.transfer_button = QPushButton("Перенести задачи ➡️")
+        self.transfer_button.setFixedSize(180, 40)
+
+        self.clear_button = QPushButton("Очистить таблицу")
+        self.clear_button.setFixedSize(180, 40)
+        self.clear_button.setProperty("variant", "danger")
+
+        top_bar = QHBoxLayout()
+        top_bar.addWidget(self.transfer_button, alignment=Qt.AlignLeft)
+        top_bar.addWidget(self.back_button, alignment=Qt.AlignLeft)
+        top_bar.addWidget(self.clear_button, alignment=Qt.AlignLeft)
+        top_bar.addStretch()
+        layout.addLayout(top_bar)
+
+        self.date_label = QLabel()
+        self.date_label.setObjectName("dateLabel")
+        self.date_label.setAlignment(Qt.AlignCenter)
+        layout.addWidget(self.date_label)
+
+        self.table = TaskTable(size)
+        layout.addWidget(self.table)
+
+    def commit_edits(self):
+        """Закрывает открытый редактор с сохранением текста и отдаёт изменения в автосохранение"""
+        # Снятие текущей ячейки закрывает редактор; отправка изменений сбрасывает снимок дня в кеше
+        self.table.setCurrentIndex(QModelIndex())
+        self.table.clearSelection()
+        self.table.push_changes()
+
+    def set_date(self, date, autosave, rows=None):
+        """Переключает окно на дату; rows — строки дня, если они уже есть, иначе модель ждёт потоковой загрузки"""
+        table = self.table
+        # Изменения прошлого дня уходят в автосохранение до загрузки новых строк
+        self.commit_edits()
+
+        self.date = date
+        self.setWindowTitle(f"{date.toString('dd.MM.yyyy')} — Таблица задач")
+        self.date_label.setText(f"Выбранная дата: {date.toString('dd.MM.yyyy')}")
+        if rows is not None:
+            table.model().load_rows(rows)
+        else:
+            table.model().start_loading()
+        table.bind_autosave(autosave, date.toString("yyyy-MM-dd"))
+        table.scrollToTop()
+
+
+class HeatMapCalendar(QCalendarWidget):
+    """Календарь, подсвечивающий дни по числу задач и доле выполненных"""
+    dates_changed = pyqtSignal(object)  # множество дат, у которых изменились задачи
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        # (год, месяц) -> {дата: (всего, сделано)} для всей видимой сетки месяца
+        self._months = {}
+        self.currentPageChanged.connect(self.load_month)
+        self.dates_changed.connect(self.refresh_dates)
+        self.load_month(self.yearShown(), self.monthShown())
+
+    @staticmethod
+    def grid_range(year, month):
+        """Первая и последняя даты, которые календарь может показать на странице месяца"""
+        first = QDate(year, month, 1)
+        return first.addDays(-7), first.addDays(42)
+
+    @profiled("db.month_stats")
+    def load_month(self, year, month):
+        if (year, month) not in self._months:
+            start, end = self.grid_range(year, month)
+            self._months[(year, month)] = day_stats(start.toString("yyyy-MM-dd"), end.toString("yyyy-MM-dd"))
+        self.updateCells()
+
+    def reload(self):
+        """Сбрасывает статистику всех месяцев (после массовых изменений в БД)"""
+        self._months.clear()
+        self.load_month(self.yearShown(), self.monthShown())
+
+    def refresh_dates(self, dates):
+        """Обновляет закешированные месяцы только для изменившихся дат"""
+        if not dates:
+            return
+        stats = day_stats_for(dates)
+        for (year, month), month_stats in self._months.items():
+            start, end = (day.toString("yyyy-MM-dd") for day in self.grid_range(year, month))
+            for date_str, counts in stats.items():
+                if start <= date_str <= end:
+                    month_stats[date_str] = counts
+        self.updateCells()
+
+    @profiled("paint.calendar_cell")
+    def paintCell(self, painter, rect, date):
+        super().paintCell(painter, rect, date)
+        month_stats = self._months.get((self.yearShown(), self.monthShown()), {})
+        total, done = month_stats.get(date.toString("yyyy-MM-dd"), (0, 0))
+        if not total:
+            return
+
+        painter.save()
+        painter.fillRect(rect.adjusted(2, 2, -2, -2), theme.heat_color(done, total))
+        painter.setFont(theme.pixel_font(painter.font(), max(10, rect.height() // 6)))
+        painter.setPen(theme.color(theme.TEXT))
+        painter.drawText(rect.adjusted(4, 2, -4, -2), Qt.AlignBottom | Qt.AlignRight, f"{done}/{total}")
+        painter.restore()
+
+
+class SearchPanel(QWidget):
+    """Окно поиска задач по всем дням; выбор результата открывает нужный день"""
+    date_selected = pyqtSignal(QDate)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Поиск задач")
+        self.resize(700, 500)
+        self.setObjectName("searchPanel")
+
+        layout = QVBoxLayout(self)
+        self.query_edit = QLineEdit()
+        self.query_edit.setPlaceholderText("Название задачи, сфера или продукт")
+        self.results = QListWidget()
+        layout.addWidget(self.query_edit)
+        layout.addWidget(self.results)
+
+        # Поиск запускается после паузы в наборе, а не на каждую букву
+        self._search_timer = QTimer(self)
+        self._search_timer.setSingleShot(True)
+        self._search_timer.setInterval(150)
+        self._search_timer.timeout.connect(self.run_search)
+        self.query_edit.textChanged.connect(self._search_timer.start)
+        self.query_edit.returnPressed.connect(self.open_first)
+        self.results.itemActivated.connect(self.open_item)
+
+    def run_search(self):
+        self.results.clear()
+        for date_str, row, sphere, title, product in search_tasks(self.query_edit.text()):
+            date = QDate.fromString(date_str, "yyyy-MM-dd")
+            details = " / ".join(part for part in (sphere, product) if part)
+            text = f"{date.toString('dd.MM.yyyy')}  —  {title or '(без названия)'}"
+            if details:
+                text += f"  ({details})"
+            item = QListWidgetItem(text)
+            item.setData(Qt.UserRole, date)
+            self.results.addItem(item)
+
+    def open_first(self):
+        self._search_timer.stop()
+        self.run_search()
+        if self.results.count():
+            self.open_item(self.results.item(0))
+
+    def open_item(self, item):
+        self.date_selected.emit(item.data(Qt.UserRole))
+
+    def keyPressEvent(self, event):
+        if event.key() == Qt.Key_Escape:
+            self.close()
+        else:
+            super().keyPressEvent(event)
+
+
+class ProfilerOverlay(QLabel):
+    """Поверх всех окон показывает сводку замеров, обновляя её раз в полсекунды"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowFlags(Qt.Tool | Qt.FramelessWindowHint | Qt.WindowStaysOnTopHint)
+        self.setAttribute(Qt.WA_ShowWithoutActivating)
+        self.setObjectName("profilerOverlay")
+        self.setFont(theme.font("monospace", 9))
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+
+    def refresh(self):
+        self.setText(profiling.profiler.report())
+        self.adjustSize()
+
+    def showEvent(self, event):
+        self.refresh()
+        self.timer.start(500)
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.timer.stop()
+        super().hideEvent(event)
+
+    def toggle(self):
+        self.setVisible(not self.isVisible())
@@ -0,0 +1,99 @@
+import numpy as np
+
+from connection import db
+from database import HAS_CONTENT
+
+ENERGY_FIELDS = ("creative", "mental", "physical", "recovery")
+ENERGY_TITLES = ("Творческая", "Умственная", "Физическая", "Восполнение")
+
+
+def load_range(start_date_str, end_date_str):
+    """Загружает задачи диапазона дат в массивы NumPy по колонкам.
+
+    Время — в секундах, оценки энергии — числа; пустые и нечисловые значения становятся NaN.
+    Пустые строки таблицы (ни одной заполненной ячейки) пропускаются.
+    """
+    energy = ", ".join(f"CASE WHEN typeof({field}) = 'integer' THEN {field} END" for field in ENERGY_FIELDS)
+    cursor = db.execute(f"""
+        SELECT date, sphere, planned_seconds, actual_seconds, done, {energy}
+        FROM tasks
+        WHERE date BETWEEN ? AND ?
+          AND {HAS_CONTENT}
+        ORDER BY date
+    """, (start_date_str, end_date_str))
+    records = cursor.fetchall()
+    columns = list(zip(*records)) if records else [()] * (5 + len(ENERGY_FIELDS))
+
+    return {
+        "date": np.array(columns[0], dtype=object),
+        "sphere": np.array(columns[1], dtype=object),
+        "planned": np.array(columns[2], dtype=float),
+        "actual": np.array(columns[3], dtype=float),
+        "done": np.array(columns[4], dtype=bool),
+        "energy": np.array(columns[5:], dtype=float).reshape(len(ENERGY_FIELDS), len(records)),
+    }
+
+
+def _grouped(keys):
+    """Уникальные ключи и номер группы для каждого элемента"""
+    if not len(keys):
+        return np.array([], dtype=object), np.array([], dtype=int)
+    return np.unique(keys.astype(str), return_inverse=True)
+
+
+def compute_stats(data):
+    """Считает сводку по загруженным массивам векторными операциями"""
+    planned, actual, done = data["planned"], data["actual"], data["done"]
+    count = len(done)
+    with_both = ~np.isnan(planned) & ~np.isnan(actual)
+
+    spheres, sphere_index = _grouped(data["sphere"])
+    dates, date_index = _grouped(data["date"])
+    day_tasks = np.bincount(date_index, minlength=len(dates))
+    day_done = np.bincount(date_index, weights=done, minlength=len(dates))
+
+    energy = data["energy"]
+    energy_known = ~np.isnan(energy)
+    energy_counts = energy_known.sum(axis=1)
+    energy_sums = np.where(energy_known, energy, 0).sum(axis=1)
+
+    return {
+        "tasks": count,
+        "done": int(done.sum()),
+        "completion_rate": float(done.mean()) if count else 0.0,
+        "planned_seconds": float(np.nansum(planned)),
+        "actual_seconds": float(np.nansum(actual)),
+        # Сравнение плана и факта — только по задачам, где известны оба времени
+        "compared_tasks": int(with_both.sum()),
+        "overrun_seconds": float((actual[with_both] - planned[with_both]).sum()),
+        "spheres": [
+            {
+                "sphere": str(sphere) or "(без сферы)",
+                "tasks": int(tasks),
+                "done": int(done_count),
+                "planned_seconds": float(planned_total),
+                "actual_seconds": float(actual_total),
+            }
+            for sphere, tasks, done_count, planned_total, actual_total in zip(
+                spheres,
+                np.bincount(sphere_index, minlength=len(spheres)),
+                np.bincount(sphere_index, weights=done, minlength=len(spheres)),
+                np.bincount(sphere_index, weights=np.nan_to_num(planned), minlength=len(spheres)),
+                np.bincount(sphere_index, weights=np.nan_to_num(actual), minlength=len(spheres)),
+            )
+        ],
+        "days": len(dates),
+        "daily_completion": {
+            str(date_str): float(rate)
+            for date_str, rate in zip(dates, np.divide(day_done, day_tasks, where=day_tasks > 0,
+                                                       out=np.zeros(len(dates))))
+        },
+        "energy_means": {
+            title: float(total / known) if known else None
+            for title, total, known in zip(ENERGY_TITLES, energy_sums, energy_counts)
+        },
+    }
+
+
+def range_stats(start_date_str, end_date_str):
+    return compute_stats(load_range(start_date_str, end_date_str))
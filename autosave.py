@@ -0,0 +1,164 @@
+import queue
+import threading
+import time
+
+from connection import db
+from database import apply_changes, day_cache
+from profiling import profiled
+
+DEBOUNCE_SECONDS = 0.5
+RETRY_SECONDS = 2.0  # пауза перед повтором неудачной записи
+STOP_ATTEMPTS = 3  # попыток записать остаток при остановке
+
+_FLUSH = object()
+_STOP = object()
+_JOURNAL = object()
+
+
+def coalesce(batches):
+    """Склеивает подряд идущие пачки одной даты, если между ними нет операций над строками"""
+    merged = []
+    for date_str, row_ops, cells in batches:
+        if date_str is _JOURNAL:
+            continue
+        if merged and merged[-1][0] == date_str and not row_ops:
+            merged[-1][2].update(cells)
+        else:
+            merged.append((date_str, list(row_ops), dict(cells)))
+    return merged
+
+
+class AutosaveWorker:
+    """Фоновый поток, который собирает изменения таблиц и пишет их в БД одной транзакцией"""
+
+    def __init__(self, debounce=DEBOUNCE_SECONDS, on_written=None, on_error=None, retry_delay=RETRY_SECONDS):
+        self.debounce = debounce
+        self.retry_delay = retry_delay
+        # Вызывается из фонового потока с множеством дат после каждой успешной записи
+        self.on_written = on_written
+        # Вызывается из фонового потока с текстом ошибки, когда запись впервые не удалась после успешной
+        self.on_error = on_error
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="autosave", daemon=True)
+        # Пачки неудачной записи: уходят первыми в следующую попытку, пока не запишутся
+        self._failed = []
+        self.failing = False
+        self.batches_written = 0
+        self.transactions = 0
+        self.failures = 0
+
+    def start(self):
+        self._thread.start()
+
+    def submit(self, date_str, row_ops, cells):
+        """Ставит в очередь изменения таблицы за дату: операции над строками и [(row, col, content)]"""
+        day_cache.invalidate(date_str)
+        self._queue.put((date_str, row_ops, {(row, col): content for row, col, content in cells}))
+
+    def journal(self, statements):
+        """Ставит в очередь запись журнала отмены [(sql, params)]; она уйдёт в одну транзакцию с изменениями ячеек"""
+        self._queue.put((_JOURNAL, [], statements))
+
+    def flush(self, wait=True):
+        """Записывает накопленные изменения, не дожидаясь окончания окна склейки"""
+        if not self._thread.is_alive():
+            return
+        done = threading.Event()
+        self._queue.put((_FLUSH, done))
+        if wait:
+            done.wait()
+
+    def stop(self):
+        """Записывает всё накопленное и останавливает поток"""
+        if self._thread.is_alive():
+            self._queue.put((_STOP, None))
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            pending, self._failed = self._failed, []
+            waiters = []
+            if pending:
+                # Повтор неудачной записи — после паузы или раньше, если пришли новые изменения или сброс
+                try:
+                    item = self._queue.get(timeout=self.retry_delay)
+                except queue.Empty:
+                    item = None
+            else:
+                item = self._queue.get()
+            stop = item is not None and self._collect(pending, waiters, item)
+
+            # Окно склейки: собираем всё, что пришло следом, пока нет паузы или явного сброса
+            deadline = time.monotonic() + self.debounce
+            while not stop and not waiters:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                stop = self._collect(pending, waiters, item)
+
+            # Всё, что уже лежит в очереди к моменту записи, уходит в ту же транзакцию
+            while not stop:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                stop = self._collect(pending, waiters, item)
+
+            self._write(pending)
+            if stop:
+                for _ in range(STOP_ATTEMPTS - 1):
+                    if not self._failed:
+                        break
+                    time.sleep(self.retry_delay)
+                    pending, self._failed = self._failed, []
+                    self._write(pending)
+            for done in waiters:
+                done.set()
+            if stop:
+                return
+
+    @staticmethod
+    def _collect(pending, waiters, item):
+        marker, payload = item[0], item[1]
+        if marker is _STOP:
+            return True
+        if marker is _FLUSH:
+            waiters.append(payload)
+        else:
+            pending.append(item)
+        return False
+
+    @profiled("autosave.write")
+    def _write(self, pending):
+        if not pending:
+            return
+        dates = {date_str for date_str, _, _ in pending if date_str is not _JOURNAL}
+        try:
+            with db.transaction():
+                for date_str, row_ops, cells in coalesce(pending):
+                    apply_changes(date_str, row_ops,
+                                  [(row, col, content) for (row, col), content in sorted(cells.items())])
+                for marker, _, statements in pending:
+                    if marker is _JOURNAL:
+                        for sql, params in statements:
+                            db.execute(sql, params)
+        except Exception as e:
+            # Модель уже отдала эти изменения, поэтому пачки остаются в очереди до успешной записи
+            self._failed = pending
+            self.failures += 1
+            if not self.failing:
+                self.failing = True
+                if self.on_error is not None:
+                    self.on_error(str(e))
+            return
+        finally:
+            day_cache.invalidate(*dates)
+        self.failing = False
+        self.batches_written += len(pending)
+        self.transactions += 1
+        if self.on_written is not None and dates:
+            self.on_written(dates)
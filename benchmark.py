@@ -0,0 +1,404 @@
+"""Замеры горячих путей приложения без дисплея (платформа Qt offscreen).
+
+    python benchmark.py [--sizes 10 100 1000 10000] [--years 3] [--repeat 5] [--output results.json]
+    python benchmark.py --compare old.json new.json
+    python benchmark.py --check-startup
+    python benchmark.py --check-leaks
+"""
+import argparse
+from datetime import date, timedelta
+import json
+import os
+from pathlib import Path
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtCore import QT_VERSION_STR, QDate, QItemSelection, QItemSelectionModel, QModelIndex, QRect
+from PyQt5.QtGui import QImage, QPainter
+from PyQt5.QtWidgets import QApplication, QStyleOptionViewItem
+
+from connection import db
+import database
+from database import TASK_FIELDS, day_cache, init_db, load_table_data, save_table_data, transfer_unfinished_tasks
+
+DEFAULT_SIZES = (10, 100, 1000, 10000)
+DAY_SWITCHES = 1000
+
+# Холодный старт: от запуска интерпретатора до показанного календаря
+COLD_START_TARGET = 1.0  # с
+# Модули, которых не должно быть в памяти до первого действия пользователя
+DEFERRED_MODULES = ("pyautogui", "numpy", "TimerWindow", "StatsWindow", "RangeWindow", "analytics", "exchange")
+STARTUP_SCRIPT = """
+import sys
+from connection import db
+db.configure(sys.argv[1])
+from System import Central
+from database import init_db
+from PyQt5.QtWidgets import QApplication
+import theme
+
+init_db()
+app = QApplication(sys.argv)
+theme.apply(app)
+screen = app.primaryScreen().size()
+central = Central(size=(screen.width(), screen.height()), color="#081436")
+app.processEvents()
+print(",".join(name for name in sys.argv[2:] if name in sys.modules))
+central.autosave.stop()
+central.loader.stop()
+db.close()
+"""
+DAY = "2024-06-03"
+SPHERES = ("Работа", "Учёба", "Спорт", "Дом", "")
+
+
+def generated_row(i):
+    """Тексты ячеек одной синтетической задачи"""
+    return [
+        SPHERES[i % len(SPHERES)],
+        f"Задача {i}: " + "подготовить и согласовать материалы " * (i % 4),
+        f"Продукт {i % 7}",
+        database.format_duration(1800 * (i % 5)) if i % 3 else "",
+        database.format_duration(1500 * (i % 6)) if i % 2 else "",
+        database.DONE_TEXT if i % 3 == 0 else "",
+        str(i % 5), str(i % 4), str(i % 3), "" if i % 6 else "восстановление",
+    ]
+
+
+def generated_rows(count):
+    return [(i, generated_row(i)) for i in range(count)]
+
+
+def insert_day(date_str, count):
+    sql = f"""
+        INSERT INTO tasks (date, position, {", ".join(TASK_FIELDS)})
+        VALUES (?, ?, {", ".join("?" * len(TASK_FIELDS))})
+    """
+    with db.transaction():
+        db.execute("DELETE FROM tasks WHERE date = ?", (date_str,))
+        db.executemany(sql, [(date_str, row, *database.row_values(cells)) for row, cells in generated_rows(count)])
+    day_cache.invalidate(date_str)
+
+
+def insert_history(years, tasks_per_day, first_day=date(2020, 1, 1)):
+    """Заполняет БД многолетней историей (по tasks_per_day задач в день)"""
+    sql = f"""
+        INSERT INTO tasks (date, position, {", ".join(TASK_FIELDS)})
+        VALUES (?, ?, {", ".join("?" * len(TASK_FIELDS))})
+    """
+    rows = [database.row_values(cells) for _, cells in generated_rows(tasks_per_day)]
+    with db.transaction():
+        for offset in range(int(365 * years)):
+            date_str = (first_day + timedelta(days=offset)).isoformat()
+            db.executemany(sql, [(date_str, row, *values) for row, values in enumerate(rows)])
+    day_cache.clear()
+
+
+def measure(action, repeat, setup=None):
+    """Минимум, медиана и все замеры action в секундах; setup выполняется перед каждым запуском вне замера"""
+    runs = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        action()
+        runs.append(time.perf_counter() - started)
+    return {"min": min(runs), "median": statistics.median(runs), "runs": runs}
+
+
+def new_table():
+    from Widgets import TaskTable
+    table = TaskTable((1600, 900))
+    table.resize(1600, 900)
+    return table
+
+
+def bench_database(size, repeat):
+    results = {}
+    insert_day(DAY, size)
+
+    table = new_table()
+    results["load_table_data"] = measure(lambda: load_table_data(table, DAY), repeat, setup=day_cache.clear)
+    results["load_table_data_cached"] = measure(lambda: load_table_data(table, DAY), repeat)
+
+    model = table.model()
+
+    def dirty_all():
+        for row in range(size):
+            model.dirty_cells.update((row, col) for col in range(model.columnCount()))
+
+    results["save_table_data_all_cells"] = measure(lambda: save_table_data(table, DAY), repeat, setup=dirty_all)
+    results["save_table_data_one_cell"] = measure(lambda: save_table_data(table, DAY), repeat,
+                                                  setup=lambda: model.dirty_cells.add((size // 2, 1)))
+
+    next_day = (date.fromisoformat(DAY) + timedelta(days=1)).isoformat()
+    results["transfer_unfinished_tasks"] = measure(lambda: transfer_unfinished_tasks(DAY), repeat,
+                                                   setup=lambda: database.clear_table_data(next_day))
+    return results
+
+
+def bench_table(size, repeat):
+    results = {}
+    table = new_table()
+    rows = generated_rows(size)
+    model = table.model()
+    results["fill_empty_cells"] = measure(table.fill_empty_cells, repeat, setup=lambda: model.load_rows(rows))
+
+    model.load_rows(rows)
+    selection = QItemSelection(model.index(0, 0), model.index(size - 1, model.columnCount() - 1))
+    table.selectionModel().select(selection, QItemSelectionModel.ClearAndSelect)
+    results["copy_selection"] = measure(table.copy_selection, repeat)
+
+    # Вставка того же блока TSV в пустую таблицу: строки добавляются одной вставкой
+    text = "\n".join(model.tsv(0, 0, size - 1, model.columnCount() - 1)) + "\n"
+    results["paste_block"] = measure(lambda: table.paste_text(text), repeat, setup=model.clear_rows)
+
+    # Отрисовка и sizeHint всех текстовых ячеек первых строк (то, что помещается на экран и чуть больше)
+    visible = min(size, 50)
+    image = QImage(1600, 2000, QImage.Format_ARGB32_Premultiplied)
+    cells = [(model.index(row, col), table.itemDelegateForColumn(col))
+             for row in range(visible) for col in range(model.columnCount())
+             if table.itemDelegateForColumn(col) is not None]
+
+    def paint_cells():
+        painter = QPainter(image)
+        option = QStyleOptionViewItem(table.viewOptions())
+        for index, delegate in cells:
+            option.rect = QRect(0, 0, 150, 120)
+            delegate.paint(painter, option, index)
+        painter.end()
+
+    def size_hints():
+        option = QStyleOptionViewItem(table.viewOptions())
+        option.rect = QRect(0, 0, 150, 120)
+        for index, delegate in cells:
+            delegate.sizeHint(option, index)
+
+    results["delegate_paint_cold"] = measure(paint_cells, repeat, setup=table.layout_cache.clear)
+    table.layout_cache.reset_stats()
+    results["delegate_paint_warm"] = measure(paint_cells, repeat)
+    results["delegate_size_hint_cold"] = measure(size_hints, repeat, setup=table.layout_cache.clear)
+    results["delegate_size_hint_warm"] = measure(size_hints, repeat)
+    # Доля попаданий с момента первого тёплого прохода: холодные прогоны sizeHint тоже входят в неё промахами
+    results["layout_cache"] = {
+        "hits": table.layout_cache.hits,
+        "misses": table.layout_cache.misses,
+        "hit_rate": table.layout_cache.hit_rate,
+    }
+    return results
+
+
+def bench_history(years, repeat):
+    results = {}
+    started = time.perf_counter()
+    insert_history(years, 30)
+    results["generate_history_seconds"] = time.perf_counter() - started
+    middle = date(2020, 1, 1) + timedelta(days=int(365 * years / 2))
+    middle_str = middle.isoformat()
+    results["fetch_day"] = measure(lambda: database.fetch_day(middle_str), repeat, setup=day_cache.clear)
+    results["day_stats_month"] = measure(
+        lambda: database.day_stats(middle.replace(day=1).isoformat(), (middle.replace(day=1) + timedelta(days=41)).isoformat()),
+        repeat)
+    results["transfer_week"] = measure(
+        lambda: transfer_unfinished_tasks(middle_str, (middle + timedelta(days=6)).isoformat()), repeat)
+    results["search_tasks"] = measure(lambda: database.search_tasks("согласовать материалы"), repeat)
+
+    # Месяц одним окном: первый экран (одна порция курсора) и весь месяц целиком
+    from RangeWindow import RangeModel
+    month_start = middle.replace(day=1).isoformat()
+    month_end = (middle.replace(day=1) + timedelta(days=30)).isoformat()
+
+    def range_first_page():
+        model = RangeModel(month_start, month_end)
+        model.fetchMore(QModelIndex())
+
+    def range_full():
+        model = RangeModel(month_start, month_end)
+        while model.canFetchMore(QModelIndex()):
+            model.fetchMore(QModelIndex())
+
+    results["range_month_first_page"] = measure(range_first_page, repeat)
+    results["range_month_full"] = measure(range_full, repeat)
+    return results
+
+
+def bench_day_switches(count, first=QDate(2020, 1, 1)):
+    """Открывает count дат подряд, как при переходах по календарю; число живых виджетов не должно расти"""
+    from System import Central
+    app = QApplication.instance()
+    central = Central(size=(1600, 900), color="#081436")
+    central.show_time_table(first)
+    app.processEvents()
+    widgets_before = len(QApplication.allWidgets())
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    for offset in range(1, count + 1):
+        central.show_time_table(first.addDays(offset))
+        app.processEvents()
+    seconds = time.perf_counter() - started
+    python_memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    widgets_after = len(QApplication.allWidgets())
+
+    central.table_wind.close()
+    central.loader.stop()
+    central.autosave.stop()
+    central.window.close()
+    for window in (central.table_wind, central.window):
+        window.deleteLater()
+    app.processEvents()
+    return {
+        "dates": count,
+        "seconds": seconds,
+        "per_switch": seconds / count,
+        "widgets_before": widgets_before,
+        "widgets_after": widgets_after,
+        # Сюда входит и кеш дней (он ограничен по строкам и по дням), поэтому утечки ищутся по виджетам
+        "python_memory_growth": python_memory,
+    }
+
+
+def bench_startup(repeat):
+    """Время холодного старта в отдельном процессе и список рано загруженных тяжёлых модулей"""
+    runs = []
+    loaded = set()
+    with tempfile.TemporaryDirectory() as directory:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT, str(Path(directory) / "startup.db"),
+                                     *DEFERRED_MODULES],
+                                    capture_output=True, text=True, cwd=Path(__file__).parent, check=True).stdout
+            runs.append(time.perf_counter() - started)
+            loaded.update(name for name in output.strip().split(",") if name)
+    return {
+        "cold_start": {"min": min(runs), "median": statistics.median(runs), "runs": runs},
+        "target": COLD_START_TARGET,
+        "eager_modules": sorted(loaded),
+    }
+
+
+def startup_regressions(startup):
+    """Нарушения бюджета запуска (пустой список — всё в порядке)"""
+    problems = []
+    if startup["cold_start"]["median"] > startup["target"]:
+        problems.append(f"холодный старт {startup['cold_start']['median']:.2f} с дольше цели {startup['target']:.2f} с")
+    if startup["eager_modules"]:
+        problems.append("при запуске загружены: " + ", ".join(startup["eager_modules"]))
+    return problems
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes, years, repeat, switches=DAY_SWITCHES):
+    app = QApplication.instance() or QApplication(sys.argv)
+    results = {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "qt": QT_VERSION_STR,
+            "platform": platform.platform(),
+            "repeat": repeat,
+        },
+        "sizes": {},
+    }
+    print("Холодный старт", file=sys.stderr)
+    results["startup"] = bench_startup(repeat)
+    with tempfile.TemporaryDirectory() as directory:
+        db.configure(Path(directory) / "bench.db")
+        init_db()
+        for size in sizes:
+            print(f"Строк в дне: {size}", file=sys.stderr)
+            results["sizes"][str(size)] = {**bench_database(size, repeat), **bench_table(size, repeat)}
+            app.processEvents()
+        if years:
+            print(f"История за {years} г.", file=sys.stderr)
+            results["history"] = bench_history(years, repeat)
+        if switches:
+            print(f"Переключение дат: {switches}", file=sys.stderr)
+            results["day_switches"] = bench_day_switches(switches)
+        results["db_stats"] = db.stats()
+        db.close()
+    return results
+
+
+def flatten(results):
+    """{'sizes/1000/load_table_data': min, ...} для сравнения двух прогонов"""
+    flat = {}
+    for size, benches in results.get("sizes", {}).items():
+        for name, value in benches.items():
+            if "min" in value:
+                flat[f"sizes/{size}/{name}"] = value["min"]
+    for name, value in results.get("history", {}).items():
+        flat[f"history/{name}"] = value["min"] if isinstance(value, dict) else value
+    if "day_switches" in results:
+        flat["day_switches/per_switch"] = results["day_switches"]["per_switch"]
+    if "startup" in results:
+        flat["startup/cold_start"] = results["startup"]["cold_start"]["median"]
+    return flat
+
+
+def compare(old_path, new_path):
+    old = flatten(json.loads(Path(old_path).read_text(encoding="utf-8")))
+    new = flatten(json.loads(Path(new_path).read_text(encoding="utf-8")))
+    for name in sorted(old.keys() & new.keys()):
+        ratio = new[name] / old[name] if old[name] else float("inf")
+        print(f"{name:60} {old[name] * 1000:10.3f} ms -> {new[name] * 1000:10.3f} ms  x{ratio:.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры TaskTable, делегатов и работы с БД")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="число строк в дне")
+    parser.add_argument("--years", type=float, default=3, help="лет синтетической истории (0 — не создавать)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="сравнить два файла результатов")
+    parser.add_argument("--switches", type=int, default=DAY_SWITCHES, help="сколько дат открыть подряд (0 — не проверять)")
+    parser.add_argument("--check-leaks", action="store_true",
+                        help="только проверить, что окно дня не копит виджеты (код возврата 1 при утечке)")
+    parser.add_argument("--check-startup", action="store_true",
+                        help="только проверить время запуска и отложенные импорты (код возврата 1 при регрессии)")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    if args.check_startup:
+        startup = bench_startup(args.repeat)
+        print(f"холодный старт: {startup['cold_start']['median']:.3f} с (цель {startup['target']:.1f} с)")
+        problems = startup_regressions(startup)
+        for problem in problems:
+            print(problem, file=sys.stderr)
+        sys.exit(1 if problems else 0)
+
+    if args.check_leaks:
+        results = run((), 0, args.repeat, args.switches)["day_switches"]
+        print(f"виджетов: {results['widgets_before']} -> {results['widgets_after']} "
+              f"за {results['dates']} дат, {results['per_switch'] * 1000:.2f} мс на переход")
+        sys.exit(1 if results["widgets_after"] > results["widgets_before"] else 0)
+
+    results = run(args.sizes, args.years, args.repeat, args.switches)
+    Path(args.output).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+    for name, value in sorted(flatten(results).items()):
+        print(f"{name:60} {value * 1000:10.3f} ms")
+    for size, benches in sorted(results["sizes"].items(), key=lambda item: int(item[0])):
+        print(f"{f'sizes/{size}/layout_cache_hit_rate':60} {benches['layout_cache']['hit_rate']:10.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+from contextlib import contextmanager
+from pathlib import Path
+import sqlite3
+import sys
+import threading
+
+from profiling import profiled
+
+if getattr(sys, 'frozen', False):
+    application_path = Path(sys.executable).parent
+else:
+    application_path = Path(__file__).parent
+
+DB_FILE = application_path / "tasks.db"
+
+# Размер кеша подготовленных выражений для каждого соединения
+STATEMENT_CACHE_SIZE = 256
+
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+)
+
+
+class ConnectionManager:
+    """Держит долгоживущие настроенные соединения с БД (по одному на поток)"""
+
+    def __init__(self, db_file=DB_FILE):
+        self.db_file = db_file
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self.opens = 0
+        self.queries = 0
+        self.transactions = 0
+
+    def connection(self):
+        """Возвращает соединение текущего потока, открывая его при первом обращении"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, isolation_level=None, check_same_thread=False,
+                                   cached_statements=STATEMENT_CACHE_SIZE)
+            for pragma in PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+            self._local.depth = 0
+            with self._lock:
+                self._connections.append(conn)
+                self.opens += 1
+        return conn
+
+    @profiled("db.execute")
+    def execute(self, sql, params=()):
+        self.queries += 1
+        return self.connection().execute(sql, params)
+
+    @profiled("db.executemany")
+    def executemany(self, sql, seq_of_params):
+        self.queries += 1
+        return self.connection().executemany(sql, seq_of_params)
+
+    @contextmanager
+    def transaction(self):
+        """Открывает транзакцию; вложенные вызовы входят во внешнюю.
+
+        Пишут несколько потоков, поэтому блокировка записи берётся сразу (BEGIN IMMEDIATE):
+        отложенная транзакция, начавшая с чтения, не сможет перейти к записи после чужого коммита.
+        """
+        conn = self.connection()
+        if self._local.depth == 0:
+            conn.execute("BEGIN IMMEDIATE")
+            self.transactions += 1
+        self._local.depth += 1
+        try:
+            yield conn
+        except BaseException:
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                conn.execute("ROLLBACK")
+            raise
+        self._local.depth -= 1
+        if self._local.depth == 0:
+            conn.execute("COMMIT")
+
+    def release(self):
+        """Закрывает соединение текущего потока (перед завершением фонового потока)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            return
+        with self._lock:
+            if conn in self._connections:
+                self._connections.remove(conn)
+        conn.close()
+        self._local.conn = None
+
+    def stats(self):
+        return {
+            "opens": self.opens,
+            "queries": self.queries,
+            "transactions": self.transactions,
+        }
+
+    def reset_stats(self):
+        self.opens = 0
+        self.queries = 0
+        self.transactions = 0
+
+    def configure(self, db_file):
+        """Переключает менеджер на другой файл БД (закрывая старые соединения)"""
+        self.close()
+        self.db_file = db_file
+
+    def close(self):
+        """Закрывает все открытые соединения"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+
+db = ConnectionManager()
@@ -1,99 +1,507 @@
-from datetime import timedelta, datetime
-from pathlib import Path
-import sqlite3
-import sys
-from PyQt5.QtCore import Qt
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from itertools import groupby
+import re
+import threading
 
-if getattr(sys, 'frozen', False):
-    application_path = Path(sys.executable).parent
-else:
-    application_path = Path(__file__).parent
+from connection import db
+from profiling import profiled
 
-DB_FILE = application_path / "tasks.db"
+SCHEMA_VERSION = 3
 
-#TODO Пофиксить SQL иньекции
-def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS tasks (
+DONE_COLUMN = 5  # колонка "Сделано"
+DONE_MARKS = ("1", "true", "yes", "да", "✔", "✓")
+DONE_TEXT = "✓"
+
+# Поля таблицы tasks для каждой колонки TaskTable (по порядку колонок)
+COLUMN_FIELDS = (
+    ("sphere",),
+    ("title",),
+    ("product",),
+    ("planned_seconds", "planned_note"),
+    ("actual_seconds", "actual_note"),
+    ("done",),
+    ("creative",),
+    ("mental",),
+    ("physical",),
+    ("recovery",),
+)
+TASK_FIELDS = tuple(field for fields in COLUMN_FIELDS for field in fields)
+# Условие SQL «в строке есть хоть одна заполненная ячейка»: пустые строки таблицы хранятся, но задачами не считаются
+HAS_CONTENT = "(" + " OR ".join("done" if field == "done" else f"COALESCE({field}, '') <> ''"
+                                for field in TASK_FIELDS) + ")"
+DURATION_COLUMNS = (3, 4)
+SCORE_COLUMNS = (6, 7, 8, 9)
+
+MIGRATION_BATCH_SIZE = 5000
+DAY_CACHE_MAX_ROWS = 50000
+DAY_CACHE_MAX_DAYS = 1000
+
+_DURATION_RE = re.compile(r"(\d{2,}):([0-5]\d):([0-5]\d)")
+
+
+def format_duration(seconds):
+    hours, rest = divmod(seconds, 3600)
+    return f"{hours:02d}:{rest // 60:02d}:{rest % 60:02d}"
+
+
+def parse_duration(text):
+    """Возвращает число секунд для строки вида HH:MM:SS или None, если это не время"""
+    match = _DURATION_RE.fullmatch(text)
+    if not match:
+        return None
+    hours, minutes, seconds = map(int, match.groups())
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def is_done(text):
+    return text.strip().lower() in DONE_MARKS
+
+
+def cell_values(col, text):
+    """Переводит текст ячейки в значения полей tasks для этой колонки"""
+    if col in DURATION_COLUMNS:
+        seconds = parse_duration(text)
+        if seconds is not None and format_duration(seconds) == text:
+            return seconds, None
+        return None, text or None
+    if col == DONE_COLUMN:
+        return (int(is_done(text)),)
+    if col in SCORE_COLUMNS:
+        stripped = text.strip()
+        if stripped.lstrip("-").isdigit():
+            return (int(stripped),)
+        return (text or None,)
+    return (text,)
+
+
+def row_values(cells):
+    """Значения всех полей tasks для строки таблицы из списка текстов ячеек"""
+    values = []
+    for col, text in enumerate(cells):
+        values.extend(cell_values(col, text))
+    return values
+
+
+def row_cells(values):
+    """Тексты ячеек строки таблицы из значений полей tasks (в порядке TASK_FIELDS)"""
+    cells = []
+    values = iter(values)
+    for col, fields in enumerate(COLUMN_FIELDS):
+        if col in DURATION_COLUMNS:
+            seconds, note = next(values), next(values)
+            cells.append(format_duration(seconds) if isinstance(seconds, int) else note or "")
+        elif col == DONE_COLUMN:
+            cells.append(DONE_TEXT if next(values) else "")
+        else:
+            value = next(values)
+            cells.append("" if value is None else str(value))
+    return cells
+
+
+def _migrate_to_task_rows():
+    """v1: одна запись на задачу с типизированными полями вместо одной записи на ячейку"""
+    legacy = db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tasks'").fetchone()
+    if legacy:
+        db.execute("ALTER TABLE tasks RENAME TO tasks_cells")
+
+    db.execute("""
+        CREATE TABLE tasks (
+            id INTEGER PRIMARY KEY,
+            date TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            sphere TEXT NOT NULL DEFAULT '',
+            title TEXT NOT NULL DEFAULT '',
+            product TEXT NOT NULL DEFAULT '',
+            planned_seconds INTEGER,
+            planned_note TEXT,
+            actual_seconds INTEGER,
+            actual_note TEXT,
+            done INTEGER NOT NULL DEFAULT 0,
+            creative INTEGER,
+            mental INTEGER,
+            physical INTEGER,
+            recovery INTEGER,
+            UNIQUE (date, position)
+        )
+    """)
+    db.execute("CREATE INDEX tasks_date_done ON tasks (date, done)")
+
+    if not legacy:
+        return
+
+    insert_sql = f"""
+        INSERT INTO tasks (date, position, {", ".join(TASK_FIELDS)})
+        VALUES (?, ?, {", ".join("?" * len(TASK_FIELDS))})
+    """
+    cursor = db.connection().execute("SELECT date, row, column, content FROM tasks_cells ORDER BY date, row")
+    batch = []
+    for (date_str, row), cells in groupby(cursor, key=lambda record: record[:2]):
+        texts = [""] * len(COLUMN_FIELDS)
+        for _, _, col, content in cells:
+            if 0 <= col < len(texts):
+                texts[col] = content or ""
+        batch.append((date_str, row, *row_values(texts)))
+        if len(batch) >= MIGRATION_BATCH_SIZE:
+            db.executemany(insert_sql, batch)
+            batch = []
+    if batch:
+        db.executemany(insert_sql, batch)
+    db.execute("DROP TABLE tasks_cells")
+
+
+def _add_full_text_search():
+    """v2: полнотекстовый индекс FTS5 по сфере, названию и продукту, синхронизируемый триггерами"""
+    db.execute("""
+        CREATE VIRTUAL TABLE tasks_fts USING fts5(
+            sphere, title, product,
+            content = 'tasks', content_rowid = 'id',
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+    """)
+    db.execute("""
+        CREATE TRIGGER tasks_fts_insert AFTER INSERT ON tasks BEGIN
+            INSERT INTO tasks_fts (rowid, sphere, title, product)
+            VALUES (new.id, new.sphere, new.title, new.product);
+        END
+    """)
+    db.execute("""
+        CREATE TRIGGER tasks_fts_delete AFTER DELETE ON tasks BEGIN
+            INSERT INTO tasks_fts (tasks_fts, rowid, sphere, title, product)
+            VALUES ('delete', old.id, old.sphere, old.title, old.product);
+        END
+    """)
+    # Сдвиг номеров строк не трогает индекс: триггер срабатывает только на изменение текстовых полей
+    db.execute("""
+        CREATE TRIGGER tasks_fts_update AFTER UPDATE OF sphere, title, product ON tasks BEGIN
+            INSERT INTO tasks_fts (tasks_fts, rowid, sphere, title, product)
+            VALUES ('delete', old.id, old.sphere, old.title, old.product);
+            INSERT INTO tasks_fts (rowid, sphere, title, product)
+            VALUES (new.id, new.sphere, new.title, new.product);
+        END
+    """)
+    db.execute("INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild')")
+
+
+def _add_journal():
+    """v3: журнал команд отмены/повтора; payload — JSON со списком изменений команды"""
+    db.execute("""
+        CREATE TABLE journal (
+            id INTEGER PRIMARY KEY,
             date TEXT NOT NULL,
-            row INTEGER NOT NULL,
-            column INTEGER NOT NULL,
-            content TEXT,
-            PRIMARY KEY (date, row, column)
+            label TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            undone INTEGER NOT NULL DEFAULT 0
         )
     """)
-    conn.commit()
-    conn.close()
+    db.execute("CREATE INDEX journal_date ON journal (date, id)")
+
+
+# Миграции по порядку: i-я переводит схему с версии i на i + 1
+_MIGRATIONS = (
+    _migrate_to_task_rows,
+    _add_full_text_search,
+    _add_journal,
+)
+
+
+def init_db():
+    """Создаёт БД или обновляет её схему до SCHEMA_VERSION"""
+    version = db.execute("PRAGMA user_version").fetchone()[0]
+    for target, migrate in enumerate(_MIGRATIONS[version:], start=version + 1):
+        with db.transaction():
+            migrate()
+            db.execute(f"PRAGMA user_version = {target}")
+
+
+class DayCache:
+    """LRU снимков дней [(номер строки, [тексты ячеек])], ограниченный суммарным числом строк и числом дней.
+
+    Пустой день считается за одну строку, поэтому предзагрузка пустых соседних дней тоже вытесняет старые.
+    Каждое изменение дня поднимает его поколение: снимок, прочитанный до изменения,
+    уже не попадёт в кеш, даже если запись в БД завершится позже чтения.
+    """
+
+    def __init__(self, max_rows=DAY_CACHE_MAX_ROWS, max_days=DAY_CACHE_MAX_DAYS):
+        self.max_rows = max_rows
+        self.max_days = max_days
+        self._days = OrderedDict()
+        # Поколения изменённых дат из общего счётчика; у дат без записи поколение — _floor
+        self._generations = {}
+        self._clock = 0
+        self._floor = 0
+        self._rows = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, date_str):
+        with self._lock:
+            rows = self._days.get(date_str)
+            if rows is None:
+                self.misses += 1
+                return None
+            self._days.move_to_end(date_str)
+            self.hits += 1
+            return rows
+
+    def __contains__(self, date_str):
+        return date_str in self._days
+
+    def __len__(self):
+        return len(self._days)
+
+    def generation(self, date_str):
+        return self._generations.get(date_str, self._floor)
 
+    def put(self, date_str, rows, generation):
+        """Сохраняет снимок, если день не менялся с момента generation"""
+        with self._lock:
+            if self.generation(date_str) != generation or len(rows) > self.max_rows:
+                return
+            self._pop(date_str)
+            self._days[date_str] = rows
+            self._rows += max(len(rows), 1)
+            while self._rows > self.max_rows or len(self._days) > self.max_days:
+                _, evicted = self._days.popitem(last=False)
+                self._rows -= max(len(evicted), 1)
 
+    def invalidate(self, *dates):
+        with self._lock:
+            for date_str in dates:
+                self._clock += 1
+                self._generations[date_str] = self._clock
+                self._pop(date_str)
+            if len(self._generations) > self.max_days:
+                self._forget_generations()
+
+    def clear(self):
+        with self._lock:
+            self._clock += 1
+            self._forget_generations()
+            self._days.clear()
+            self._rows = 0
+
+    def _forget_generations(self):
+        # Забытые даты получают поколение не меньше любого выданного: начатые до этого чтения
+        # не попадут в кеш (лишний промах), а изменения не потеряются
+        self._floor = self._clock
+        self._generations.clear()
+
+    def _pop(self, date_str):
+        rows = self._days.pop(date_str, None)
+        if rows is not None:
+            self._rows -= max(len(rows), 1)
+
+
+day_cache = DayCache()
+
+
+def _upsert_sql(fields):
+    return f"""
+        INSERT INTO tasks (date, position, {", ".join(fields)})
+        VALUES (?, ?, {", ".join("?" * len(fields))})
+        ON CONFLICT (date, position) DO UPDATE SET
+            {", ".join(f"{field} = excluded.{field}" for field in fields)}
+    """
+
+
+# Заранее собранные запросы записи одной колонки, имена полей берутся только из COLUMN_FIELDS
+_UPSERT_COLUMN_SQL = tuple(_upsert_sql(fields) for fields in COLUMN_FIELDS)
+
+
+def _shift_rows(date_str, row, delta):
+    """Сдвигает номера строк начиная с row на delta (через отрицательные значения, чтобы не нарушить ключ)"""
+    if delta > 0:
+        db.execute("UPDATE tasks SET position = -position - 1 WHERE date = ? AND position >= ?", (date_str, row))
+        db.execute("UPDATE tasks SET position = -position WHERE date = ? AND position < 0", (date_str,))
+    else:
+        db.execute("UPDATE tasks SET position = -position WHERE date = ? AND position > ?", (date_str, row))
+        db.execute("UPDATE tasks SET position = -position - 1 WHERE date = ? AND position < 0", (date_str,))
+
+
+@profiled("db.apply_changes")
+def apply_changes(date_str, row_ops, cells):
+    """Применяет операции над строками и изменённые ячейки [(row, col, content)] в текущей транзакции"""
+    for op, row in row_ops:
+        if op == "delete":
+            db.execute("DELETE FROM tasks WHERE date = ? AND position = ?", (date_str, row))
+            _shift_rows(date_str, row, -1)
+        else:
+            _shift_rows(date_str, row, 1)
+
+    # Одна пачка на колонку: значения ячейки раскладываются в типизированные поля
+    by_column = {}
+    for row, col, content in cells:
+        by_column.setdefault(col, []).append((date_str, row, *cell_values(col, content)))
+    for col, params in by_column.items():
+        db.executemany(_UPSERT_COLUMN_SQL[col], params)
+
+
+@profiled("table.save")
 def save_table_data(table, date_str):
-    """Сохраняет все данные из таблицы в БД по указанной дате"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+    """Сохраняет в БД только изменённые с прошлого сохранения ячейки таблицы"""
+    row_ops, cells = table.model().take_changes()
+    if not row_ops and not cells:
+        return
+
+    with db.transaction():
+        apply_changes(date_str, row_ops, cells)
+    day_cache.invalidate(date_str)
+
+
+@profiled("db.fetch_day")
+def fetch_day(date_str):
+    """Возвращает [(номер строки, [тексты ячеек])] за указанную дату (из кеша, если день там есть)"""
+    rows = day_cache.get(date_str)
+    if rows is not None:
+        return rows
+
+    generation = day_cache.generation(date_str)
+    cursor = db.execute(f"""
+        SELECT position, {", ".join(TASK_FIELDS)} FROM tasks
+        WHERE date = ? ORDER BY position
+    """, (date_str,))
+    rows = [(record[0], row_cells(record[1:])) for record in cursor.fetchall()]
+    day_cache.put(date_str, rows, generation)
+    return rows
+
+
+def iter_day(date_str, chunk_size=500):
+    """Отдаёт строки за дату порциями [(номер строки, [тексты ячеек])] по мере чтения из БД.
 
-    for row in range(table.rowCount()):
-        for col in range(table.columnCount()):
-            item = table.item(row, col)
-            content = item.text() if item else ""
-            cursor.execute("""
-                INSERT OR REPLACE INTO tasks (date, row, column, content)
-                VALUES (?, ?, ?, ?)
-            """, (date_str, row, col, content))
+    Полностью прочитанный день попадает в кеш, следующий вызов отдаёт порции из снимка.
+    """
+    rows = day_cache.get(date_str)
+    if rows is not None:
+        for start in range(0, len(rows), chunk_size):
+            yield rows[start:start + chunk_size]
+        return
 
-    conn.commit()
-    conn.close()
+    generation = day_cache.generation(date_str)
+    cursor = db.execute(f"""
+        SELECT position, {", ".join(TASK_FIELDS)} FROM tasks
+        WHERE date = ? ORDER BY position
+    """, (date_str,))
+    snapshot = []
+    while True:
+        records = cursor.fetchmany(chunk_size)
+        if not records:
+            break
+        rows = [(record[0], row_cells(record[1:])) for record in records]
+        snapshot.extend(rows)
+        yield rows
+    day_cache.put(date_str, snapshot, generation)
+
+
+@profiled("db.range")
+def range_page(after, end_date_str, limit):
+    """Следующие limit задач после ключа after = (дата, номер строки) до даты end_date_str включительно.
 
+    Первая страница диапазона начинается с after = (первая дата, -1), каждая следующая — с ключа
+    последней записи предыдущей: запрос сразу встаёт на этот ключ в индексе (date, position),
+    и между страницами не остаётся открытого курсора со старым снимком БД.
+    Возвращает [(дата, номер строки, [тексты ячеек])].
+    """
+    cursor = db.execute(f"""
+        SELECT date, position, {", ".join(TASK_FIELDS)} FROM tasks
+        WHERE (date, position) > (?, ?) AND date <= ? AND {HAS_CONTENT}
+        ORDER BY date, position
+        LIMIT ?
+    """, (*after, end_date_str, limit))
+    return [(record[0], record[1], row_cells(record[2:])) for record in cursor.fetchall()]
 
+
+@profiled("table.load")
 def load_table_data(table, date_str):
     """Загружает данные в таблицу из БД по указанной дате"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+    table.model().load_rows(fetch_day(date_str))
+
+
+@profiled("db.transfer")
+def transfer_unfinished_tasks(date_str, end_date_str=None):
+    """Переносит невыполненные задачи каждого дня из диапазона на следующий день"""
+    end_date_str = end_date_str or date_str
+    fields = ", ".join(TASK_FIELDS)
+
+    # Фильтр и копирование выполняются целиком внутри SQLite одним запросом по индексу (date, done)
+    with db.transaction():
+        db.execute(f"""
+            INSERT INTO tasks (date, position, {fields})
+            SELECT date(date, '+1 day'), position, {fields}
+            FROM tasks
+            WHERE date BETWEEN ? AND ? AND done = 0
+            ORDER BY date, position
+            ON CONFLICT (date, position) DO UPDATE SET
+                {", ".join(f"{field} = excluded.{field}" for field in TASK_FIELDS)}
+        """, (date_str, end_date_str))
+
+    start = datetime.strptime(date_str, "%Y-%m-%d")
+    days = (datetime.strptime(end_date_str, "%Y-%m-%d") - start).days
+    day_cache.invalidate(*((start + timedelta(days=offset + 1)).strftime("%Y-%m-%d") for offset in range(days + 1)))
+
+
+def day_stats(start_date_str, end_date_str):
+    """Число задач и выполненных задач по дням диапазона одним запросом: {дата: (всего, сделано)}.
+
+    Пустые строки таблицы не считаются.
+    """
+    cursor = db.execute(f"""
+        SELECT date, COUNT(*), SUM(done) FROM tasks
+        WHERE date BETWEEN ? AND ? AND {HAS_CONTENT}
+        GROUP BY date
+    """, (start_date_str, end_date_str))
+    return {date_str: (total, done) for date_str, total, done in cursor}
+
+
+def day_stats_for(dates):
+    """То же, что day_stats, для произвольного набора дат; для дат без задач возвращает (0, 0)"""
+    dates = list(dates)
+    stats = dict.fromkeys(dates, (0, 0))
+    cursor = db.execute(f"""
+        SELECT date, COUNT(*), SUM(done) FROM tasks
+        WHERE date IN ({", ".join("?" * len(dates))}) AND {HAS_CONTENT}
+        GROUP BY date
+    """, dates)
+    stats.update((date_str, (total, done)) for date_str, total, done in cursor)
+    return stats
+
+
+def _match_query(text):
+    """Превращает ввод пользователя в запрос FTS5: каждое слово ищется по префиксу, спецсимволы экранируются"""
+    terms = text.split()
+    return " ".join('"' + term.replace('"', '""') + '"*' for term in terms)
+
+
+@profiled("db.search")
+def search_tasks(text, limit=100):
+    """Ищет задачи по всем дням: [(дата, номер строки, сфера, название, продукт)] по убыванию релевантности"""
+    query = _match_query(text)
+    if not query:
+        return []
+    # Совпадения в названии задачи весят больше, чем в сфере и продукте
+    cursor = db.execute("""
+        SELECT tasks.date, tasks.position, tasks.sphere, tasks.title, tasks.product
+        FROM tasks_fts
+        JOIN tasks ON tasks.id = tasks_fts.rowid
+        WHERE tasks_fts MATCH ?
+        ORDER BY bm25(tasks_fts, 1.0, 4.0, 2.0)
+        LIMIT ?
+    """, (query, limit))
+    return cursor.fetchall()
+
+
+def restore_day(date_str, rows):
+    """Заменяет задачи дня строками [(номер строки, [тексты ячеек])] одной транзакцией"""
+    with db.transaction():
+        db.execute("DELETE FROM tasks WHERE date = ?", (date_str,))
+        db.executemany(_upsert_sql(TASK_FIELDS), [(date_str, row, *row_values(cells)) for row, cells in rows])
+    day_cache.invalidate(date_str)
+
+
+def clear_table_data(date_str):
+    """Удаляет все записи таблицы за указанную дату"""
+    with db.transaction():
+        db.execute("DELETE FROM tasks WHERE date = ?", (date_str,))
+    day_cache.invalidate(date_str)
 
-    cursor.execute("""
-        SELECT row, column, content FROM tasks WHERE date = ?
-    """, (date_str,))
-    for row, col, content in cursor.fetchall():
-        from PyQt5.QtWidgets import QTableWidgetItem
-        item = QTableWidgetItem(content)
-        item.setFlags(item.flags() | Qt.ItemIsEditable)
-        item.setTextAlignment(Qt.AlignTop | Qt.AlignLeft)
-        table.setItem(row, col, item)
-
-    conn.close()
-
-def transfer_unfinished_tasks(date_str):
-    """Переносит невыполненные задачи на следующий день"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-
-    # Получаем все задачи за дату
-    cursor.execute("""
-        SELECT row, column, content FROM tasks WHERE date = ?
-    """, (date_str,))
-    tasks = cursor.fetchall()
-
-    # Определяем следующую дату
-    current_date = datetime.strptime(date_str, "%Y-%m-%d")
-    next_date = current_date + timedelta(days=1)
-    next_date_str = next_date.strftime("%Y-%m-%d")
-
-    # Находим невыполненные задачи
-    tasks_by_row = {}
-    for row, col, content in tasks:
-        if row not in tasks_by_row:
-            tasks_by_row[row] = {}
-        tasks_by_row[row][col] = content
-
-    for row, columns in tasks_by_row.items():
-        done = columns.get(5, "")  # 5-я колонка — "Сделано"
-        if done.strip().lower() not in ["1", "true", "yes", "да", "✔", "✓"]:
-            for col, content in columns.items():
-                cursor.execute("""
-                    INSERT OR REPLACE INTO tasks (date, row, column, content)
-                    VALUES (?, ?, ?, ?)
-                """, (next_date_str, row, col, content))
-
-    conn.commit()
-    conn.close()
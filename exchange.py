@@ -0,0 +1,153 @@
+import argparse
+import csv
+from itertools import islice
+import json
+from pathlib import Path
+import time
+
+from connection import db
+from database import TASK_FIELDS, day_cache, init_db
+
+EXPORT_FIELDS = ("date", "position") + TASK_FIELDS
+INTEGER_FIELDS = {"position", "planned_seconds", "actual_seconds", "done", "creative", "mental", "physical",
+                  "recovery"}
+# Значения полей NOT NULL, которых нет в файле
+DEFAULTS = {"sphere": "", "title": "", "product": "", "done": 0}
+TRANSACTION_ROWS = 50000
+
+
+def _format(path, fmt):
+    fmt = fmt or ("csv" if Path(path).suffix.lower() == ".csv" else "jsonl")
+    if fmt not in ("csv", "jsonl"):
+        raise ValueError(f"Неизвестный формат: {fmt}")
+    return fmt
+
+
+def _range_filter(start_date_str, end_date_str):
+    conditions, params = [], []
+    if start_date_str:
+        conditions.append("date >= ?")
+        params.append(start_date_str)
+    if end_date_str:
+        conditions.append("date <= ?")
+        params.append(end_date_str)
+    return (f"WHERE {' AND '.join(conditions)}" if conditions else ""), params
+
+
+def iter_tasks(start_date_str=None, end_date_str=None):
+    """Построчно отдаёт задачи из БД (курсор не материализуется в памяти)"""
+    where, params = _range_filter(start_date_str, end_date_str)
+    yield from db.execute(f"""
+        SELECT {", ".join(EXPORT_FIELDS)} FROM tasks {where}
+        ORDER BY date, position
+    """, params)
+
+
+def _csv_value(field, text):
+    """Восстанавливает тип значения из CSV: пусто — NULL или значение по умолчанию, целые в числовых полях — int"""
+    if text == "" and field != "date":
+        return DEFAULTS.get(field)
+    if field in INTEGER_FIELDS and text.lstrip("-").isdigit():
+        return int(text)
+    return text
+
+
+def read_csv(path):
+    with open(path, newline="", encoding="utf-8") as file:
+        reader = csv.reader(file)
+        header = next(reader)
+        for values in reader:
+            record = dict(zip(header, values))
+            yield tuple(_csv_value(field, record.get(field, "")) for field in EXPORT_FIELDS)
+
+
+def read_jsonl(path):
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                record = json.loads(line)
+                yield tuple(DEFAULTS.get(field) if record.get(field) is None else record[field]
+                            for field in EXPORT_FIELDS)
+
+
+def export_tasks(path, fmt=None, start_date_str=None, end_date_str=None):
+    """Выгружает задачи в CSV или JSON Lines; возвращает (число строк, секунды)"""
+    fmt = _format(path, fmt)
+    started = time.perf_counter()
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        if fmt == "csv":
+            writer = csv.writer(file)
+            writer.writerow(EXPORT_FIELDS)
+            for record in iter_tasks(start_date_str, end_date_str):
+                writer.writerow("" if value is None else value for value in record)
+                count += 1
+        else:
+            for record in iter_tasks(start_date_str, end_date_str):
+                file.write(json.dumps(dict(zip(EXPORT_FIELDS, record)), ensure_ascii=False))
+                file.write("\n")
+                count += 1
+    return count, time.perf_counter() - started
+
+
+def import_tasks(path, fmt=None, start_date_str=None, end_date_str=None):
+    """Загружает задачи из файла большими транзакциями, заменяя строки с теми же (дата, номер строки).
+
+    Возвращает (число строк, секунды).
+    """
+    fmt = _format(path, fmt)
+    records = read_csv(path) if fmt == "csv" else read_jsonl(path)
+    if start_date_str or end_date_str:
+        records = (record for record in records
+                   if (not start_date_str or record[0] >= start_date_str)
+                   and (not end_date_str or record[0] <= end_date_str))
+
+    # Строки сначала пишутся во временную таблицу, а в tasks попадают одним INSERT ... SELECT:
+    # так триггеры полнотекстового индекса срабатывают внутри одного выражения, а не на каждую строку
+    fields = ", ".join(EXPORT_FIELDS)
+    db.execute(f"CREATE TEMP TABLE IF NOT EXISTS import_staging ({fields})")
+    started = time.perf_counter()
+    count = 0
+    try:
+        while True:
+            batch = list(islice(records, TRANSACTION_ROWS))
+            if not batch:
+                break
+            with db.transaction():
+                db.executemany(f"INSERT INTO import_staging VALUES ({', '.join('?' * len(EXPORT_FIELDS))})", batch)
+                db.execute(f"""
+                    INSERT INTO tasks ({fields})
+                    SELECT {fields} FROM import_staging WHERE true
+                    ON CONFLICT (date, position) DO UPDATE SET
+                        {", ".join(f"{field} = excluded.{field}" for field in TASK_FIELDS)}
+                """)
+                db.execute("DELETE FROM import_staging")
+            count += len(batch)
+    finally:
+        # Прерванный импорт мог успеть записать первые пачки
+        day_cache.clear()
+    return count, time.perf_counter() - started
+
+
+def throughput(count, seconds):
+    return f"{count} строк за {seconds:.2f} с ({count / seconds if seconds else 0:.0f} строк/с)"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Экспорт и импорт задач из tasks.db")
+    parser.add_argument("command", choices=("export", "import"))
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="по умолчанию — по расширению файла")
+    parser.add_argument("--from", dest="start", help="первая дата диапазона, ГГГГ-ММ-ДД")
+    parser.add_argument("--to", dest="end", help="последняя дата диапазона, ГГГГ-ММ-ДД")
+    args = parser.parse_args(argv)
+
+    init_db()
+    action = export_tasks if args.command == "export" else import_tasks
+    count, seconds = action(args.path, args.format, args.start, args.end)
+    print(throughput(count, seconds))
+    db.close()
+
+
+if __name__ == '__main__':
+    main()
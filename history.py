@@ -0,0 +1,271 @@
+"""Отмена и повтор изменений таблицы дня.
+
+Команда — это подпись и список изменений:
+    ("cell", row, col, old, new)   — текст ячейки
+    ("insert", row)                — вставка пустой строки
+    ("delete", row, cells)         — удаление строки с её текстами
+    ("clear", rows)                — очистка дня, rows = [(номер строки, [тексты ячеек])] непустых строк
+Команды каждого дня хранятся в таблице journal и переживают перезапуск. Записи журнала идут через
+фоновое автосохранение вместе с изменениями ячеек, поток интерфейса из журнала только читает.
+"""
+from collections import OrderedDict
+from contextlib import contextmanager
+import json
+
+from connection import db
+from database import clear_table_data, restore_day
+
+MAX_COMMANDS = 500  # команд в истории одного дня
+MAX_CHARS = 2_000_000  # примерный объём текста в истории одного дня
+LOADED_DAYS = 16  # сколько дней держать в памяти
+
+
+def _command_size(ops):
+    size = 0
+    for op in ops:
+        size += 16
+        if op[0] == "cell":
+            size += len(op[3]) + len(op[4])
+        elif op[0] == "delete":
+            size += sum(map(len, op[2]))
+        elif op[0] == "clear":
+            size += sum(16 + sum(map(len, cells)) for _, cells in op[1])
+    return size
+
+
+class Command:
+    __slots__ = ("id", "label", "ops", "size")
+
+    def __init__(self, label, ops, command_id=None):
+        self.id = command_id
+        self.label = label
+        self.ops = ops
+        self.size = _command_size(ops)
+
+
+def _next_journal_id():
+    return db.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM journal").fetchone()[0]
+
+
+class DayHistory:
+    """Стеки отмены и повтора одного дня.
+
+    writer — AutosaveWorker, через который пишется журнал (без него запись идёт сразу в БД);
+    next_id выдаёт номера новых команд, не дожидаясь записи.
+    """
+
+    def __init__(self, date_str, writer=None, next_id=_next_journal_id):
+        self.date_str = date_str
+        self.writer = writer
+        self._next_id = next_id
+        self.undo_stack = []
+        self.redo_stack = []
+        self.size = 0
+        self.replaying = False
+        self._group = None
+        self._group_depth = 0
+
+        for command_id, label, payload, undone in db.execute("""
+            SELECT id, label, payload, undone FROM journal WHERE date = ? ORDER BY id
+        """, (date_str,)):
+            command = Command(label, [tuple(op) for op in json.loads(payload)], command_id)
+            if undone:
+                # Следующей повторяется самая ранняя отменённая команда, она должна оказаться на вершине
+                self.redo_stack.insert(0, command)
+            else:
+                self.undo_stack.append(command)
+                self.size += command.size
+
+    # Запись изменений
+
+    @contextmanager
+    def group(self, label):
+        """Объединяет все изменения внутри блока в одну команду (вставка, очистка и т.п.)"""
+        if self._group_depth == 0:
+            self._group = Command(label, [])
+        self._group_depth += 1
+        try:
+            yield
+        finally:
+            self._group_depth -= 1
+            if self._group_depth == 0:
+                command, self._group = self._group, None
+                if command.ops:
+                    self._push(Command(command.label, command.ops))
+
+    def _record(self, label, op):
+        if self.replaying:
+            return
+        if self._group is not None:
+            self._group.ops.append(op)
+        else:
+            self._push(Command(label, [op]))
+
+    def record_cell(self, row, col, old, new):
+        self._record("Изменение ячейки", ("cell", row, col, old, new))
+
+    def record_insert(self, row):
+        self._record("Вставка строки", ("insert", row))
+
+    def record_delete(self, row, cells):
+        self._record("Удаление строки", ("delete", row, cells))
+
+    def record_clear(self, rows):
+        self._record("Очистка таблицы", ("clear", rows))
+
+    def _write(self, statements):
+        """Записывает изменения журнала [(sql, params)] одной транзакцией"""
+        if self.writer is not None:
+            self.writer.journal(statements)
+            return
+        with db.transaction():
+            for sql, params in statements:
+                db.execute(sql, params)
+
+    def _push(self, command):
+        statements = []
+        # Новая команда обрывает ветку повтора
+        if self.redo_stack:
+            statements.append(("DELETE FROM journal WHERE date = ? AND undone = 1", (self.date_str,)))
+            self.redo_stack.clear()
+        command.id = self._next_id()
+        statements.append(("""
+            INSERT INTO journal (id, date, label, payload) VALUES (?, ?, ?, ?)
+        """, (command.id, self.date_str, command.label, json.dumps(command.ops, ensure_ascii=False))))
+        self.undo_stack.append(command)
+        self.size += command.size
+        statements.extend(self._trim())
+        self._write(statements)
+
+    def _trim(self):
+        """Выбрасывает самые старые команды сверх ограничений по числу и объёму; возвращает запросы удаления"""
+        dropped = None
+        while len(self.undo_stack) > 1 and (len(self.undo_stack) > MAX_COMMANDS or self.size > MAX_CHARS):
+            dropped = self.undo_stack.pop(0)
+            self.size -= dropped.size
+        if dropped is None:
+            return []
+        # Ветка повтора к этому моменту пуста, поэтому выброшенные команды — все записи дня до последней из них
+        return [("DELETE FROM journal WHERE date = ? AND id <= ?", (self.date_str, dropped.id))]
+
+    # Отмена и повтор
+
+    def can_undo(self):
+        return bool(self.undo_stack)
+
+    def can_redo(self):
+        return bool(self.redo_stack)
+
+    def undo(self, model):
+        """Отменяет последнюю команду в модели открытого дня; возвращает её или None"""
+        if not self.undo_stack or model.loading:
+            return None
+        command = self.undo_stack.pop()
+        self.size -= command.size
+        self._replay(model, reversed(command.ops), undo=True)
+        self._write([("UPDATE journal SET undone = 1 WHERE id = ?", (command.id,))])
+        self.redo_stack.append(command)
+        return command
+
+    def redo(self, model):
+        """Повторяет последнюю отменённую команду; возвращает её или None"""
+        if not self.redo_stack or model.loading:
+            return None
+        command = self.redo_stack.pop()
+        self._replay(model, command.ops, undo=False)
+        self._write([("UPDATE journal SET undone = 0 WHERE id = ?", (command.id,))])
+        self.undo_stack.append(command)
+        self.size += command.size
+        return command
+
+    def _replay(self, model, ops, undo):
+        # Пустые строки в конце дня не сохраняются, поэтому после перезагрузки история может ссылаться
+        # на строки, которых в модели нет: недостающие строки добавляются, удалять отсутствующие нечего
+        self.replaying = True
+        try:
+            cells = []
+            for op in ops:
+                kind = op[0]
+                if kind == "cell":
+                    # Подряд идущие ячейки применяются к модели одной пачкой
+                    row, col, old, new = op[1:]
+                    cells.append((row, col, old if undo else new))
+                    continue
+                if cells:
+                    self._set_cells(model, cells)
+                    cells = []
+                if kind == "insert":
+                    if not undo:
+                        model.insert_row(min(op[1], model.rowCount()))
+                    elif op[1] < model.rowCount():
+                        model.remove_row(op[1])
+                elif kind == "delete":
+                    row, texts = op[1:]
+                    if undo:
+                        _extend(model, row)
+                        model.insert_row(row)
+                        self._set_cells(model, [(row, col, text) for col, text in enumerate(texts) if text])
+                    elif row < model.rowCount():
+                        model.remove_row(row)
+                elif kind == "clear":
+                    # День целиком восстанавливается или очищается одной транзакцией в обход автосохранения
+                    if undo:
+                        rows = [(row, list(texts)) for row, texts in op[1]]
+                        restore_day(self.date_str, rows)
+                        model.load_rows(rows)
+                    else:
+                        clear_table_data(self.date_str)
+                        model.clear_rows()
+                        model.mark_clean()
+            if cells:
+                self._set_cells(model, cells)
+        finally:
+            self.replaying = False
+
+    @staticmethod
+    def _set_cells(model, cells):
+        # Пустой текст в отсутствующую строку писать незачем, под остальные строки модель дополняется
+        cells = [cell for cell in cells if cell[0] < model.rowCount() or cell[2]]
+        if cells:
+            _extend(model, max(row for row, _, _ in cells) + 1)
+            model.set_cells(cells)
+
+
+def _extend(model, count):
+    """Дополняет модель пустыми строками до count строк"""
+    while model.rowCount() < count:
+        model.insert_row(model.rowCount())
+
+
+class History:
+    """Истории дней, подгружаемые из журнала по мере открытия"""
+
+    def __init__(self, writer=None, loaded_days=LOADED_DAYS):
+        self.writer = writer
+        self.loaded_days = loaded_days
+        self._days = OrderedDict()
+        self._last_id = None
+
+    def next_id(self):
+        # Журнал пишет только это приложение, поэтому номера выдаются по счётчику от последнего записанного
+        if self._last_id is None:
+            self._last_id = _next_journal_id() - 1
+        self._last_id += 1
+        return self._last_id
+
+    def day(self, date_str):
+        history = self._days.get(date_str)
+        if history is None:
+            if self.writer is not None:
+                # Выгруженный из памяти день мог оставить записи журнала в очереди автосохранения
+                self.writer.flush()
+            history = self._days[date_str] = DayHistory(date_str, self.writer, self.next_id)
+            while len(self._days) > self.loaded_days:
+                self._days.popitem(last=False)
+        else:
+            self._days.move_to_end(date_str)
+        return history
+
+    def clear(self):
+        self._days.clear()
+
@@ -0,0 +1,75 @@
+from itertools import count
+
+from PyQt5.QtCore import QObject, QThread, Qt, pyqtSignal
+
+from connection import db
+from database import day_cache, fetch_day, iter_day
+from profiling import profiled
+
+CHUNK_SIZE = 500
+
+
+class DayLoader(QObject):
+    """Читает строки дня в отдельном потоке и отдаёт их порциями через сигналы"""
+    rows_loaded = pyqtSignal(int, list)  # (номер запроса, порция строк)
+    loading_finished = pyqtSignal(int)
+    _load_requested = pyqtSignal(int, str)
+    _prefetch_requested = pyqtSignal(str)
+
+    def __init__(self, autosave=None, chunk_size=CHUNK_SIZE):
+        super().__init__()
+        self.autosave = autosave
+        self.chunk_size = chunk_size
+        self._ids = count(1)
+        self._cancelled = set()
+
+        self._thread = QThread()
+        self._thread.setObjectName("day-loader")
+        self.moveToThread(self._thread)
+        self._load_requested.connect(self._load)
+        self._prefetch_requested.connect(self._prefetch)
+        # Сигнал finished приходит из самого потока — там же закрываем его соединение
+        self._thread.finished.connect(db.release, Qt.DirectConnection)
+        self._thread.start()
+
+    def request(self, date_str):
+        """Ставит загрузку дня в очередь и возвращает номер запроса"""
+        request_id = next(self._ids)
+        self._load_requested.emit(request_id, date_str)
+        return request_id
+
+    def prefetch(self, *dates):
+        """Заранее читает дни в кеш, не отправляя их в таблицу"""
+        for date_str in dates:
+            self._prefetch_requested.emit(date_str)
+
+    def cancel(self, request_id):
+        self._cancelled.add(request_id)
+
+    def stop(self):
+        self._thread.quit()
+        self._thread.wait()
+
+    @profiled("loader.load")
+    def _load(self, request_id, date_str):
+        if self.autosave is not None:
+            # Несохранённые изменения должны попасть в БД до чтения
+            self.autosave.flush()
+        chunks = iter_day(date_str, self.chunk_size)
+        for rows in chunks:
+            if request_id in self._cancelled:
+                # Недочитанный день не попадает в кеш
+                chunks.close()
+                break
+            self.rows_loaded.emit(request_id, rows)
+        if request_id in self._cancelled:
+            self._cancelled.discard(request_id)
+        else:
+            self.loading_finished.emit(request_id)
+
+    def _prefetch(self, date_str):
+        if date_str not in day_cache:
+            if self.autosave is not None:
+                # Иначе в кеш попадёт снимок без изменений, которые ещё ждут записи
+                self.autosave.flush()
+            fetch_day(date_str)
@@ -1,18 +1,36 @@
-from System import Central
-import pyautogui
 import sys
+import profiling
+
+# Замеры включаются до импорта модулей, функции которых они оборачивают
+if "--profile" in sys.argv:
+    sys.argv.remove("--profile")
+    profiling.enable()
+
+from System import Central
+from connection import application_path, db
 from database import init_db
+import theme
 from PyQt5.QtWidgets import QApplication
 
+PROFILE_FILE = application_path / "profile.json"
+
 if __name__ == '__main__':
     init_db()
     app = QApplication(sys.argv)
+    theme.apply(app)
 
     try:
-        screen_size = pyautogui.size()
+        screen = app.primaryScreen().size()
+        screen_size = (screen.width(), screen.height())
         central = Central(size=screen_size, color="#081436")
         app.setQuitOnLastWindowClosed(True)
+        app.aboutToQuit.connect(central.save_open_table)
+        app.aboutToQuit.connect(central.loader.stop)
+        app.aboutToQuit.connect(central.autosave.stop)
+        app.aboutToQuit.connect(db.close)
+        if profiling.enabled:
+            app.aboutToQuit.connect(lambda: profiling.profiler.dump(PROFILE_FILE))
         sys.exit(app.exec_())
     except Exception as e:
         print(f"Ошибка при запуске приложения: {e}")
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
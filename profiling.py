@@ -0,0 +1,141 @@
+"""Необязательные замеры горячих путей.
+
+Включаются флагом --profile в main.py или переменной окружения TASK_LEVELING_PROFILE=1.
+Решение принимается при объявлении функции: выключенный profiled() возвращает функцию
+без обёртки, так что в обычном запуске замеры ничего не стоят.
+"""
+import functools
+import json
+import os
+import threading
+import time
+
+ENV_VAR = "TASK_LEVELING_PROFILE"
+FRAME_BUDGET = 1 / 60  # бюджет одного кадра отрисовки таблицы, с
+
+enabled = os.environ.get(ENV_VAR, "") not in ("", "0")
+
+
+def enable():
+    """Включает замеры; действует на модули, импортированные после вызова"""
+    global enabled
+    enabled = True
+
+
+class Profiler:
+    """Копит число вызовов и время по именованным точкам и статистику кадров"""
+
+    def __init__(self, frame_budget=FRAME_BUDGET):
+        self.frame_budget = frame_budget
+        self._lock = threading.Lock()
+        # Показатели, которые считают сами объекты (доля попаданий в кеш и т.п.): имя -> функция без аргументов
+        self.gauges = {}
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.calls = {}  # имя -> [число вызовов, суммарное время, максимум]
+            self.frames = 0
+            self.slow_frames = 0
+            self.frame_time = 0.0
+            self.worst_frame = 0.0
+
+    def record(self, name, seconds):
+        with self._lock:
+            entry = self.calls.get(name)
+            if entry is None:
+                self.calls[name] = [1, seconds, seconds]
+            else:
+                entry[0] += 1
+                entry[1] += seconds
+                if seconds > entry[2]:
+                    entry[2] = seconds
+
+    def gauge(self, name, read):
+        """Регистрирует показатель name, значение которого read() читается при каждой сводке"""
+        self.gauges[name] = read
+
+    def record_frame(self, seconds):
+        with self._lock:
+            self.frames += 1
+            self.frame_time += seconds
+            if seconds > self.frame_budget:
+                self.slow_frames += 1
+            if seconds > self.worst_frame:
+                self.worst_frame = seconds
+
+    def snapshot(self):
+        gauges = {name: read() for name, read in self.gauges.items()}
+        with self._lock:
+            return {
+                "gauges": gauges,
+                "calls": {name: {"count": count, "total": total, "max": worst}
+                          for name, (count, total, worst) in self.calls.items()},
+                "frames": {
+                    "count": self.frames,
+                    "budget": self.frame_budget,
+                    "over_budget": self.slow_frames,
+                    "average": self.frame_time / self.frames if self.frames else 0.0,
+                    "worst": self.worst_frame,
+                },
+            }
+
+    def report(self):
+        """Текстовая сводка: точки по убыванию суммарного времени и кадры"""
+        snapshot = self.snapshot()
+        lines = [f"{'точка':28} {'вызовов':>8} {'всего, мс':>10} {'макс, мс':>9}"]
+        calls = sorted(snapshot["calls"].items(), key=lambda item: item[1]["total"], reverse=True)
+        for name, entry in calls:
+            lines.append(f"{name:28} {entry['count']:8} {entry['total'] * 1000:10.1f} {entry['max'] * 1000:9.2f}")
+        frames = snapshot["frames"]
+        if snapshot["gauges"]:
+            lines.append("")
+            lines.extend(f"{name:28} {value:10.1%}" for name, value in sorted(snapshot["gauges"].items()))
+        lines.append("")
+        lines.append(f"кадров: {frames['count']}, дольше {frames['budget'] * 1000:.1f} мс: {frames['over_budget']}, "
+                     f"в среднем {frames['average'] * 1000:.2f} мс, худший {frames['worst'] * 1000:.2f} мс")
+        return "\n".join(lines)
+
+    def dump(self, path):
+        """Сохраняет замеры в JSON-файл"""
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.snapshot(), file, ensure_ascii=False, indent=2)
+
+
+profiler = Profiler()
+
+
+def profiled(name):
+    """Декоратор: считает вызовы и время функции под именем name (только при включённых замерах)"""
+    def decorate(function):
+        if not enabled:
+            return function
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profiler.record(name, time.perf_counter() - started)
+        return wrapper
+    return decorate
+
+
+def frame(name):
+    """Как profiled(), но дополнительно учитывает вызов как кадр отрисовки"""
+    def decorate(function):
+        if not enabled:
+            return function
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - started
+                profiler.record(name, seconds)
+                profiler.record_frame(seconds)
+        return wrapper
+    return decorate
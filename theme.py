@@ -0,0 +1,245 @@
+"""Оформление приложения: одна таблица стилей на всё приложение и общие объекты для отрисовки.
+
+Виджеты не получают собственных setStyleSheet: нужный стиль выбирается по objectName
+или свойству variant, а таблица разбирается Qt один раз при apply().
+"""
+from functools import lru_cache
+
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QColor, QPen, QFont
+
+BACKGROUND = "#081436"
+PANEL = "#0A1A3F"
+ACCENT = "#0078D7"
+ACCENT_LIGHT = "#3399FF"
+TRACK = "#404040"
+TEXT = "white"
+HEAT_EMPTY = "#D72A2A"
+HEAT_DONE = "#2AD76A"
+
+STYLESHEET = """
+QWidget {
+    background-color: #081436;
+    color: white;
+}
+
+QPushButton {
+    border-radius: 5px;
+    background-color: #0078D7;
+    color: white;
+    font-size: 16px;
+}
+QPushButton:hover {
+    background-color: #005bb5;
+}
+QPushButton:disabled {
+    background-color: #505050;
+}
+QPushButton[variant="danger"] {
+    background-color: #D72A2A;
+}
+QPushButton[variant="danger"]:hover {
+    background-color: #D21F1F;
+}
+
+/* Календарь главного окна */
+QCalendarWidget#calendar {
+    border: 2px solid #0A1A3F;
+    border-radius: 15px;
+    padding: 5px;
+}
+#calendar QWidget {
+    background-color: #0078D7;
+}
+#calendar QMenu {
+    background-color: #0A1A3F;
+    color: white;
+}
+#calendar QAbstractItemView {
+    selection-background-color: #081436;
+    selection-color: white;
+    background-color: #0078D7;
+    gridline-color: #14284A;
+    color: black;
+    font-size: 25px;
+}
+#calendar QAbstractItemView::disabled {
+    color: #444B6E;
+}
+
+/* Окно дня и таблица задач */
+QLabel#dateLabel {
+    font-size: 20px;
+}
+QTableView#taskTable {
+    gridline-color: #0078D7;
+    font-size: 14px;
+    selection-background-color: #3399FF;
+    selection-color: white;
+}
+#taskTable QHeaderView::section {
+    background-color: #0078D7;
+    color: white;
+    padding: 5px;
+    font-size: 16px;
+    border: 1px solid #0A1A3F;
+}
+#taskTable QTableCornerButton::section {
+    background-color: #0078D7;
+    border: 1px solid #0A1A3F;
+}
+QTextEdit#cellEditor {
+    font-size: 20px;
+    border: 2px solid #0078D7;
+    padding: 2px;
+    color: #0078D7;
+}
+QWidget#rowMenu {
+    background-color: #0A1A3F;
+}
+#rowMenu QPushButton {
+    font-size: 14px;
+    padding: 5px 10px;
+    border: none;
+    border-radius: 4px;
+}
+#rowMenu QPushButton:hover {
+    background-color: #3399FF;
+}
+
+/* Таймер */
+#timerWindow, #timerWindow QWidget {
+    background-color: #0A1A3F;
+}
+#timerWindow QPushButton {
+    background-color: #0078D7;
+    padding: 6px 12px;
+    min-width: 80px;
+    font-size: 14px;
+}
+#timerWindow QPushButton:hover {
+    background-color: #0095FF;
+}
+#timerWindow QPushButton:disabled {
+    background-color: #505050;
+}
+QPushButton#finishButton {
+    background-color: #3399FF;
+    min-width: 0;
+}
+QPushButton#finishButton:hover {
+    background-color: #1F80D2;
+}
+
+/* Статистика и поиск */
+#statsWindow, #statsWindow QWidget, #searchPanel, #searchPanel QWidget {
+    font-size: 16px;
+}
+#statsWindow QPushButton {
+    padding: 5px 12px;
+}
+#statsWindow QDateEdit {
+    border: 2px solid #0078D7;
+    border-radius: 5px;
+    padding: 3px;
+}
+#statsWindow QHeaderView::section {
+    background-color: #0078D7;
+    color: white;
+    padding: 5px;
+    border: 1px solid #0A1A3F;
+}
+#statsWindow QTableWidget {
+    gridline-color: #0078D7;
+}
+#searchPanel QLineEdit {
+    border: 2px solid #0078D7;
+    border-radius: 5px;
+    padding: 5px;
+}
+#searchPanel QListWidget {
+    border: 1px solid #0A1A3F;
+}
+#searchPanel QListWidget::item:selected {
+    background-color: #3399FF;
+}
+
+/* Задачи за неделю или месяц */
+#rangeWindow {
+    font-size: 14px;
+}
+QLabel#rangeLabel {
+    font-size: 18px;
+    padding: 0 8px;
+}
+#rangeWindow QPushButton {
+    padding: 5px 12px;
+}
+#rangeWindow QTreeView {
+    border: 1px solid #0A1A3F;
+    selection-background-color: #3399FF;
+    selection-color: white;
+}
+#rangeWindow QHeaderView::section {
+    background-color: #0078D7;
+    color: white;
+    padding: 5px;
+    border: 1px solid #0A1A3F;
+}
+
+QLabel#profilerOverlay {
+    background-color: rgba(8, 20, 54, 220);
+    padding: 8px;
+}
+"""
+
+
+def apply(app):
+    """Ставит таблицу стилей приложению (один раз за запуск)"""
+    if app.styleSheet() != STYLESHEET:
+        app.setStyleSheet(STYLESHEET)
+
+
+# Объекты для paintEvent и делегатов создаются один раз и дальше только читаются
+
+@lru_cache(maxsize=None)
+def color(name):
+    return QColor(name)
+
+
+@lru_cache(maxsize=None)
+def pen(name, width=1, cap=Qt.SquareCap):
+    result = QPen(color(name), width)
+    result.setCapStyle(cap)
+    return result
+
+
+@lru_cache(maxsize=None)
+def font(family, point_size=-1, weight=-1):
+    return QFont(family, point_size, weight)
+
+
+@lru_cache(maxsize=256)
+def _pixel_font(key, pixel_size):
+    result = QFont()
+    result.fromString(key)
+    result.setPixelSize(pixel_size)
+    return result
+
+
+def pixel_font(base, pixel_size):
+    """Шрифт base с размером в пикселях (кешируется по описанию шрифта и размеру)"""
+    return _pixel_font(base.toString(), pixel_size)
+
+
+@lru_cache(maxsize=1024)
+def heat_color(done, total):
+    """Цвет дня на тепловой карте: от красного к зелёному по доле сделанного, плотнее при большем числе задач"""
+    empty, full = color(HEAT_EMPTY), color(HEAT_DONE)
+    ratio = done / total
+    return QColor(
+        int(empty.red() + (full.red() - empty.red()) * ratio),
+        int(empty.green() + (full.green() - empty.green()) * ratio),
+        int(empty.blue() + (full.blue() - empty.blue()) * ratio),
+        min(60 + total * 12, 170),
+    )